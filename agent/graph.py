@@ -1,8 +1,16 @@
 # standard library
 from typing import Annotated, Literal, TypedDict
 # third-party library
+from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    ToolCall,
+    ToolMessage,
+)
 from langchain_core.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
@@ -11,19 +19,46 @@ from langchain_core.prompts import (
 )
 from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.vectorstores import VectorStore
-from langchain_mistralai import ChatMistralAI
 from langgraph.graph import StateGraph, add_messages
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import ToolNode
 from langgraph.types import Checkpointer
+from langgraph.utils.runnable import RunnableCallable
+import numpy as np
 # local
-from .tools import get_tools
+from .history import ChatHistoryManager
+from .tools import (
+    RETRIEVER_TOOL_NAME,
+    format_documents,
+    get_retriever,
+    get_tools,
+    normalize_query,
+    tool_call_key,
+)
+from rag_helpers import metrics
+from rag_helpers.cache import RetrievalCache
+
+
+class Prefetch(TypedDict):
+    query: str
+    embedding: list[float]
+    content: str
+    documents: list[Document]
 
 
 class State(TypedDict):
+    # the current question
     input: str
-    chat_history: list[BaseMessage]
+    # earlier turns and the summary of the turns before them; both are
+    # carried across turns by the checkpointer
+    chat_history: Annotated[list[BaseMessage], add_messages]
+    summary: str
+    # tool-calling loop of the current turn
     messages: Annotated[list[BaseMessage], add_messages]
+    # speculative retrieval for the raw input of the current turn
+    prefetch: Prefetch | None
+    # tool results of the current turn by tool_call_key
+    tool_memo: dict[str, str]
 
 
 class Config(TypedDict):
@@ -39,17 +74,43 @@ class Agent:
         vector_store: VectorStore,
         k: int = 5,
         verbose: bool = True,
+        retrieval_cache: RetrievalCache | None = None,
+        search_filter: dict | None = None,
+        search_type: Literal["similarity", "mmr", "hybrid"] = "similarity",
+        fetch_k: int = 20,
+        llm: BaseChatModel | None = None,
+        history_max_tokens: int = 2000,
+        speculative_retrieval: bool = False,
+        speculative_threshold: float = 0.9,
+        max_parallel_tools: int = 4,
+        max_iterations: int = 5,
     ) -> None:
         self.verbose = verbose
-        self.llm: BaseChatModel = ChatMistralAI(
-            model=model,
-            temperature=temperature,
-            max_retries=2,
+        # ``llm`` overrides the Mistral model, e.g. with agent.local.LocalChatModel
+        if llm is None:
+            # the Mistral client is slow to import and unused with ``llm``
+            from langchain_mistralai import ChatMistralAI
+            llm = ChatMistralAI(model=model, temperature=temperature, max_retries=2)
+        self.llm: BaseChatModel = llm
+        self.retriever = get_retriever(
+            vector_store, k=k, retrieval_cache=retrieval_cache,
+            search_filter=search_filter, search_type=search_type, fetch_k=fetch_k,
         )
-        self.tools = get_tools(topic, vector_store, k=k)
+        self.tools = get_tools(topic, vector_store, retriever=self.retriever)
+        # speculative retrieval: search for the raw input while the first
+        # LLM call runs and answer search tool calls whose query embeds
+        # within ``speculative_threshold`` cosine similarity from it
+        self.embeddings = vector_store.embeddings
+        self.speculative_retrieval = speculative_retrieval
+        self.speculative_threshold = speculative_threshold
         self.tool_node = ToolNode(self.tools)
+        self.history = ChatHistoryManager(self.llm, max_tokens=history_max_tokens)
+        self.max_parallel_tools = max_parallel_tools
+        # LLM calls per turn; the last one gets no tools, so it must answer
+        self.max_iterations = max_iterations
         llm_with_tools = self.llm.bind_tools(self.tools)
         self.answer_chain = self.get_chain(llm_with_tools)
+        self.final_chain = self.get_chain(self.llm)
         self.workflow = self.get_graph()
 
     def get_chain(self, llm: Runnable) -> Runnable:
@@ -80,14 +141,255 @@ class Agent:
         else:
             return "exit"
 
+    def prompt_inputs(self, state: State) -> dict:
+        return {
+            "input": state["input"],
+            "chat_history": self.history.prompt_history(
+                state.get("summary", ""), state.get("chat_history", [])
+            ),
+            "messages": state.get("messages", []),
+        }
+
+    def compact_history(self, state: State) -> dict | None:
+        return self.history.compact(state.get("summary", ""), state.get("chat_history", []))
+
+    async def acompact_history(self, state: State) -> dict | None:
+        return await self.history.acompact(
+            state.get("summary", ""), state.get("chat_history", [])
+        )
+
+    def finish_turn(self, state: State) -> dict:
+        # keep only the question and the final answer; the tool-calling
+        # messages of this turn are dropped
+        return {
+            "chat_history": [HumanMessage(content=state["input"]), state["messages"][-1]],
+            "messages": [RemoveMessage(id=m.id) for m in state["messages"]],
+            "prefetch": None,
+            "tool_memo": {},
+        }
+
+    def prefetch(self, state: State) -> dict:
+        with metrics.span("prefetch"):
+            embedding = self.embeddings.embed_query(state["input"])
+            documents = self.retriever.search_by_vector(state["input"], embedding)
+        return {"prefetch": Prefetch(
+            query=state["input"],
+            embedding=list(embedding),
+            content=format_documents(documents),
+            documents=documents,
+        )}
+
+    async def aprefetch(self, state: State) -> dict:
+        with metrics.span("prefetch"):
+            embedding = await self.embeddings.aembed_query(state["input"])
+            documents = await self.retriever.asearch_by_vector(state["input"], embedding)
+        return {"prefetch": Prefetch(
+            query=state["input"],
+            embedding=list(embedding),
+            content=format_documents(documents),
+            documents=documents,
+        )}
+
+    @staticmethod
+    def speculative_queries(state: State) -> list[str]:
+        """Search queries of the pending tool calls that need embedding
+        to be compared with the prefetched one."""
+        prefetch = state.get("prefetch")
+        if not prefetch:
+            return []
+        return [
+            tool_call["args"].get("query", "")
+            for tool_call in state["messages"][-1].tool_calls
+            if tool_call["name"] == RETRIEVER_TOOL_NAME
+            and normalize_query(tool_call["args"].get("query", ""))
+            != normalize_query(prefetch["query"])
+        ]
+
+    def use_prefetch(
+        self, state: State, embedded: dict[str, list[float]]
+    ) -> tuple[State | None, list[ToolMessage]]:
+        """
+        Answer the search tool calls that match the prefetched query; the
+        returned state holds the remaining tool calls, or is None if none
+        are left.
+        """
+        prefetch = state.get("prefetch")
+        last_message: AIMessage = state["messages"][-1]
+        if not prefetch:
+            return state, []
+        reference = np.asarray(prefetch["embedding"])
+        reference /= np.linalg.norm(reference) or 1.0
+        reused, remaining = [], []
+        for tool_call in last_message.tool_calls:
+            if tool_call["name"] != RETRIEVER_TOOL_NAME:
+                remaining.append(tool_call)
+                continue
+            query = tool_call["args"].get("query", "")
+            if query in embedded:
+                vector = np.asarray(embedded[query])
+                similarity = float(vector @ reference) / (np.linalg.norm(vector) or 1.0)
+                hit = similarity >= self.speculative_threshold
+            else:
+                hit = True  # same text as the prefetched query
+            metrics.inc("speculative_retrieval_total", outcome="hit" if hit else "miss")
+            if hit:
+                reused.append(ToolMessage(
+                    content=prefetch["content"],
+                    artifact=prefetch["documents"],
+                    name=tool_call["name"],
+                    tool_call_id=tool_call["id"],
+                ))
+            else:
+                remaining.append(tool_call)
+        if not remaining:
+            return None, reused
+        if reused:
+            state = self.with_tool_calls(state, remaining)
+        return state, reused
+
+    @staticmethod
+    def with_tool_calls(state: State, tool_calls: list[ToolCall]) -> State:
+        last_message: AIMessage = state["messages"][-1]
+        return {
+            **state,
+            "messages": [
+                *state["messages"][:-1],
+                last_message.model_copy(update={"tool_calls": tool_calls}),
+            ],
+        }
+
+    @staticmethod
+    def plan_tool_calls(
+        state: State | None, memo: dict[str, str]
+    ) -> tuple[list[ToolCall], list[ToolMessage], list[tuple[ToolCall, str]]]:
+        """
+        Split the pending tool calls into calls to run, calls answered from
+        this turn's memo and duplicates of a call that is about to run.
+        """
+        if state is None:
+            return [], [], []
+        pending, answered, duplicates = [], [], []
+        running = set()
+        for tool_call in state["messages"][-1].tool_calls:
+            key = tool_call_key(tool_call)
+            if key in memo:
+                answered.append(ToolMessage(
+                    content=memo[key], name=tool_call["name"], tool_call_id=tool_call["id"]
+                ))
+            elif key in running:
+                duplicates.append((tool_call, key))
+            else:
+                running.add(key)
+                pending.append(tool_call)
+                continue
+            metrics.inc("tool_calls_deduplicated_total", tool=tool_call["name"])
+        return pending, answered, duplicates
+
+    @staticmethod
+    def collect_tool_results(
+        tool_calls: list[ToolCall],
+        memo: dict[str, str],
+        answered: list[ToolMessage],
+        results: list[ToolMessage],
+        duplicates: list[tuple[ToolCall, str]],
+    ) -> dict:
+        """Tool messages for every call of the turn plus the updated memo."""
+        keys = {tool_call["id"]: tool_call_key(tool_call) for tool_call in tool_calls}
+        memo = dict(memo)
+        by_key = {}
+        for message in [*answered, *results]:
+            by_key[keys[message.tool_call_id]] = message
+            if message.status != "error":
+                memo[keys[message.tool_call_id]] = message.content
+        copies = [
+            by_key[key].model_copy(update={"tool_call_id": tool_call["id"], "id": None})
+            for tool_call, key in duplicates
+        ]
+        return {"messages": [*answered, *results, *copies], "tool_memo": memo}
+
+    @staticmethod
+    def record_llm_usage(response: AIMessage, attributes: dict) -> None:
+        attributes["iterations"] = 1
+        attributes["tool_calls"] = len(response.tool_calls)
+        if response.usage_metadata:
+            attributes["input_tokens"] = response.usage_metadata["input_tokens"]
+            attributes["output_tokens"] = response.usage_metadata["output_tokens"]
+
+    @staticmethod
+    def record_tool_calls(state: State) -> None:
+        for tool_call in state["messages"][-1].tool_calls:
+            metrics.inc("tool_calls_total", tool=tool_call["name"])
+
+    def get_turn_chain(self, state: State) -> Runnable:
+        iterations = sum(isinstance(m, AIMessage) for m in state.get("messages", []))
+        if iterations + 1 >= self.max_iterations:
+            metrics.inc("agent_iteration_cap_total")
+            return self.final_chain
+        return self.answer_chain
+
     def run_llm(self, state: State, config: RunnableConfig) -> dict:
-        response: AIMessage = self.answer_chain.invoke(state, config)
+        with metrics.span("llm") as attributes:
+            chain = self.get_turn_chain(state)
+            response: AIMessage = chain.invoke(self.prompt_inputs(state), config)
+            self.record_llm_usage(response, attributes)
         if self.verbose:
             response.pretty_print()
         return {"messages": [response]}
 
     def run_tools(self, state: State, config: RunnableConfig) -> dict:
-        response = self.tool_node.invoke(state, config)
+        self.record_tool_calls(state)
+        tool_calls = state["messages"][-1].tool_calls
+        memo = state.get("tool_memo") or {}
+        with metrics.span("tools"):
+            queries = self.speculative_queries(state)
+            embedded = dict(zip(queries, self.embeddings.embed_documents(queries))) if queries else {}
+            state, prefetched = self.use_prefetch(state, embedded)
+            pending, answered, duplicates = self.plan_tool_calls(state, memo)
+            results = []
+            if pending:
+                # ToolNode runs the calls on a thread pool of max_concurrency
+                results = self.tool_node.invoke(
+                    self.with_tool_calls(state, pending),
+                    {**config, "max_concurrency": self.max_parallel_tools},
+                )["messages"]
+            response = self.collect_tool_results(
+                tool_calls, memo, [*prefetched, *answered], results, duplicates
+            )
+        if self.verbose:
+            for m in response["messages"]:
+                m.pretty_print()
+        return response
+
+    async def arun_llm(self, state: State, config: RunnableConfig) -> dict:
+        with metrics.span("llm") as attributes:
+            chain = self.get_turn_chain(state)
+            response: AIMessage = await chain.ainvoke(self.prompt_inputs(state), config)
+            self.record_llm_usage(response, attributes)
+        if self.verbose:
+            response.pretty_print()
+        return {"messages": [response]}
+
+    async def arun_tools(self, state: State, config: RunnableConfig) -> dict:
+        self.record_tool_calls(state)
+        tool_calls = state["messages"][-1].tool_calls
+        memo = state.get("tool_memo") or {}
+        with metrics.span("tools"):
+            queries = self.speculative_queries(state)
+            embedded = (
+                dict(zip(queries, await self.embeddings.aembed_documents(queries)))
+                if queries else {}
+            )
+            state, prefetched = self.use_prefetch(state, embedded)
+            pending, answered, duplicates = self.plan_tool_calls(state, memo)
+            results = []
+            for i in range(0, len(pending), self.max_parallel_tools):
+                # ToolNode gathers the calls of each batch concurrently
+                batch = pending[i:i + self.max_parallel_tools]
+                response = await self.tool_node.ainvoke(self.with_tool_calls(state, batch), config)
+                results.extend(response["messages"])
+            response = self.collect_tool_results(
+                tool_calls, memo, [*prefetched, *answered], results, duplicates
+            )
         if self.verbose:
             for m in response["messages"]:
                 m.pretty_print()
@@ -95,15 +397,27 @@ class Agent:
 
     def get_graph(self) -> StateGraph:
         workflow = StateGraph(State, config_schema=Config)
-        workflow.add_node("agent", self.run_llm)
-        workflow.add_node("tools", self.run_tools)
-        workflow.add_edge("__start__", "agent")
+        # sync and async implementations of each node, so that the compiled
+        # graph serves both invoke/stream and ainvoke/astream natively
+        workflow.add_node(
+            "history", RunnableCallable(self.compact_history, self.acompact_history)
+        )
+        workflow.add_node("agent", RunnableCallable(self.run_llm, self.arun_llm))
+        workflow.add_node("tools", RunnableCallable(self.run_tools, self.arun_tools))
+        workflow.add_node("finish", self.finish_turn)
+        workflow.add_edge("__start__", "history")
+        workflow.add_edge("history", "agent")
+        if self.speculative_retrieval:
+            # runs in the same step as the first LLM call
+            workflow.add_node("speculate", RunnableCallable(self.prefetch, self.aprefetch))
+            workflow.add_edge("history", "speculate")
         workflow.add_conditional_edges(
             "agent",
             path=self.should_continue,
-            path_map={"continue": "tools", "exit": "__end__"}
+            path_map={"continue": "tools", "exit": "finish"}
         )
         workflow.add_edge("tools", "agent")
+        workflow.add_edge("finish", "__end__")
         return workflow
 
     def compile(self, checkpointer: Checkpointer | None = None) -> CompiledStateGraph:
@@ -0,0 +1,108 @@
+"""
+Token-budgeted chat history.
+
+The agent keeps the conversation in its checkpointed state. Once the
+history grows past ``max_tokens``, the oldest turns are folded into a
+rolling summary and removed, so that the prompt stops growing. Compaction
+trims the history to half the budget; the next summary call is then only
+needed after another half-budget's worth of turns.
+"""
+# standard library
+from typing import Sequence
+# third-party library
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+)
+from langchain_core.prompts import ChatPromptTemplate
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "Summarize the conversation between a user and an AI assistant below "
+            "in a few sentences. Keep facts, names, dates and open questions that "
+            "later questions may refer to. Extend the existing summary, if any.",
+        ),
+        ("human", "Existing summary:\n{summary}\n\nConversation:\n{conversation}"),
+    ]
+)
+
+
+def count_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Rough token count: about four characters per token plus a small
+    per-message overhead, which is close enough for budgeting."""
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+def split_history(
+    messages: Sequence[BaseMessage], max_tokens: int
+) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """
+    Split into (older, recent) where ``recent`` is the longest suffix that
+    fits in ``max_tokens`` and starts with a user message, so that turns
+    are never cut in half.
+    """
+    start = len(messages)
+    used = 0
+    for i in range(len(messages) - 1, -1, -1):
+        used += count_tokens([messages[i]])
+        if used > max_tokens:
+            break
+        if isinstance(messages[i], HumanMessage):
+            start = i
+    return list(messages[:start]), list(messages[start:])
+
+
+class ChatHistoryManager:
+    def __init__(self, llm: BaseChatModel, max_tokens: int = 2000) -> None:
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.chain = SUMMARY_PROMPT | llm
+
+    @staticmethod
+    def format(messages: Sequence[BaseMessage]) -> str:
+        return "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+    def prompt_history(self, summary: str, history: list[BaseMessage]) -> list[BaseMessage]:
+        """Chat history as sent to the model: the summary, then recent turns."""
+        if not summary:
+            return history
+        return [SystemMessage(f"Summary of the earlier conversation: {summary}"), *history]
+
+    def _split(self, history: list[BaseMessage]) -> list[BaseMessage] | None:
+        if count_tokens(history) <= self.max_tokens:
+            return None
+        older, _ = split_history(history, self.max_tokens // 2)
+        return older or None
+
+    def _update(self, summary: str, older: list[BaseMessage]) -> dict:
+        return {
+            "summary": summary,
+            "chat_history": [RemoveMessage(id=m.id) for m in older],
+        }
+
+    def compact(self, summary: str, history: list[BaseMessage]) -> dict | None:
+        """
+        State update folding the oldest turns into the summary, or None
+        while the history is within budget.
+        """
+        older = self._split(history)
+        if older is None:
+            return None
+        response = self.chain.invoke(
+            {"summary": summary or "(none)", "conversation": self.format(older)}
+        )
+        return self._update(str(response.content), older)
+
+    async def acompact(self, summary: str, history: list[BaseMessage]) -> dict | None:
+        older = self._split(history)
+        if older is None:
+            return None
+        response = await self.chain.ainvoke(
+            {"summary": summary or "(none)", "conversation": self.format(older)}
+        )
+        return self._update(str(response.content), older)
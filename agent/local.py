@@ -0,0 +1,101 @@
+"""
+Local stand-in for the Mistral chat model.
+
+``LocalChatModel`` plays the agent deterministically and offline: for a new
+user question it calls the retriever tool with the question as the query,
+and once the tool has answered it replies with the first words of the
+retrieved context. Together with ``rag_helpers.local.LocalSession`` this
+lets the whole agent run without credentials, e.g. for benchmarks.
+"""
+# standard library
+import json
+import time
+import uuid
+from typing import Any, Iterator, Sequence
+# third-party library
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class LocalChatModel(BaseChatModel):
+    """
+    Deterministic ReAct chat model. ``latency`` is slept before every
+    response and ``token_latency`` before every streamed token, to simulate
+    a remote model.
+    """
+
+    tool_name: str = "search-for-context"
+    answer_words: int = 40
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def bind_tools(self, tools: Sequence[BaseTool | dict], **kwargs: Any) -> Runnable:
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _respond(self, messages: list[BaseMessage], tools: list[dict]) -> AIMessage:
+        time.sleep(self.latency)
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            words = str(last.content).split()[:self.answer_words]
+            return AIMessage(content=" ".join(words) or "I don't know the answer to that question.")
+        if any(t["function"]["name"] == self.tool_name for t in tools):
+            return AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": self.tool_name,
+                    "args": {"query": str(last.content)},
+                    "id": uuid.uuid4().hex[:9],
+                }],
+            )
+        # no tools bound, e.g. when summarizing
+        return AIMessage(content=" ".join(str(last.content).split()[:self.answer_words]))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools", []))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self._respond(messages, kwargs.get("tools", []))
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {
+                        "name": t["name"],
+                        "args": json.dumps(t["args"]),
+                        "id": t["id"],
+                        "index": i,
+                    }
+                    for i, t in enumerate(message.tool_calls)
+                ],
+            ))
+            return
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency)
+            token = word if i == len(words) - 1 else word + " "
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -1,13 +1,23 @@
 # standard library
 from datetime import datetime
+import json
 from typing import Literal
 from zoneinfo import ZoneInfo
 # third-party library
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document
+from langchain_core.messages import ToolCall
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.tools import tool, create_retriever_tool
+from langchain_core.tools import BaseTool, Tool, tool
+from langchain_core.tools.retriever import RetrieverInput
 from langchain_core.vectorstores import VectorStore
+# local
+from rag_helpers.cache import RetrievalCache, normalize_query
+from rag_helpers.retrievers import SemanticCacheRetriever
 
 TIMEZONE = ZoneInfo("US/Pacific")
+RETRIEVER_TOOL_NAME = "search-for-context"
+DOCUMENT_SEPARATOR = "\n\n"
 
 
 @tool("get-today-tool")
@@ -25,19 +35,76 @@ def get_today() -> tuple[
     return weekday, today
 
 
-def get_tools(topic: str, vector_store: VectorStore, k: int = 5) -> BaseRetriever:
-    retriever = vector_store.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": k}
+def get_retriever(
+    vector_store: VectorStore,
+    k: int = 5,
+    retrieval_cache: RetrievalCache | None = None,
+    search_filter: dict | None = None,
+    search_type: Literal["similarity", "mmr", "hybrid"] = "similarity",
+    fetch_k: int = 20,
+) -> SemanticCacheRetriever:
+    return SemanticCacheRetriever(
+        vector_store=vector_store, cache=retrieval_cache, k=k,
+        filter=search_filter, search_type=search_type, fetch_k=fetch_k,
     )
+
+
+def format_documents(documents: list[Document]) -> str:
+    # same output as the retriever tool with its default document prompt
+    return DOCUMENT_SEPARATOR.join(d.page_content for d in documents)
+
+
+def tool_call_key(tool_call: ToolCall) -> str:
+    """Calls with equal keys return the same result within a turn."""
+    args = dict(tool_call["args"])
+    if tool_call["name"] == RETRIEVER_TOOL_NAME:
+        args["query"] = normalize_query(str(args.get("query", "")))
+    return tool_call["name"] + json.dumps(args, sort_keys=True, default=str)
+
+
+def get_tools(
+    topic: str,
+    vector_store: VectorStore,
+    k: int = 5,
+    retrieval_cache: RetrievalCache | None = None,
+    search_filter: dict | None = None,
+    search_type: Literal["similarity", "mmr", "hybrid"] = "similarity",
+    fetch_k: int = 20,
+    retriever: BaseRetriever | None = None,
+) -> list[BaseTool]:
+    if retriever is None:
+        retriever = get_retriever(
+            vector_store, k, retrieval_cache, search_filter, search_type, fetch_k
+        )
     description = (
         f"Search for information about {topic}. "
         f"For any questions about {topic}, you must use this tool. "
         "Use the noun or the phrase most similar to the search."
     )
-    retriever_tool = create_retriever_tool(
-        retriever,
-        name="search-for-context",
+    return [get_today, get_retriever_tool(retriever, description)]
+
+
+def get_retriever_tool(retriever: BaseRetriever, description: str) -> BaseTool:
+    """
+    Like ``create_retriever_tool``, but the retrieved documents are also
+    attached to the tool message as its ``artifact``, so that callers can
+    tell which chunks an answer was based on.
+    """
+    def search(query: str, callbacks: Callbacks = None) -> tuple[str, list[Document]]:
+        documents = retriever.invoke(query, config={"callbacks": callbacks})
+        return format_documents(documents), documents
+
+    async def asearch(
+        query: str, callbacks: Callbacks = None
+    ) -> tuple[str, list[Document]]:
+        documents = await retriever.ainvoke(query, config={"callbacks": callbacks})
+        return format_documents(documents), documents
+
+    return Tool(
+        name=RETRIEVER_TOOL_NAME,
         description=description,
+        func=search,
+        coroutine=asearch,
+        args_schema=RetrieverInput,
+        response_format="content_and_artifact",
     )
-    return [get_today, retriever_tool]
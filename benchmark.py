@@ -0,0 +1,339 @@
+"""
+Offline benchmarks.
+
+Runs entirely on the local stand-ins (rag_helpers.local.LocalSession for
+Snowflake and Cortex, agent.local.LocalChatModel for Mistral), so no
+credentials are needed, and prints the results as JSON:
+
+    python benchmark.py --sizes 1000 5000 --queries 100 --output bench.json
+
+Measured are ingestion throughput (chunks/s), similarity_search latency
+percentiles per corpus size and search backend (with recall@k against
+exact search for the quantized ones; hybrid keyword + vector search
+includes embedding the query), end-to-end agent turn latency, the
+statements (and DDL among them) it takes to open a new topic per storage
+mode, and cold start: the import time of the app's helpers in a fresh
+interpreter and the time to build and compile the agent graph that
+sessions share.
+The absolute numbers only describe the stand-ins; compare runs of the same
+machine to spot regressions. The same goes for recall: the stand-in's
+hashed bag-of-words embeddings are sparse, which is the worst case for
+binary sign codes, so binary recall here is far below what dense Cortex
+embeddings reach at the same rescore factor.
+"""
+# standard library
+import argparse
+import json
+import platform
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable
+# third-party library
+from langchain_core.documents import Document
+from langgraph.checkpoint.memory import InMemorySaver
+# local
+from agent.graph import Agent
+from agent.local import LocalChatModel
+from rag_helpers.local import LocalSession
+from rag_helpers.vectorstore import SnowflakeCortexVectorStore
+from utils.ingest import IngestData
+from utils.pipeline import IngestPipeline
+
+VOCABULARY = (
+    "food court restroom floor parking garage cinema shoe store hours open "
+    "close elevator escalator gift card lost found atm pharmacy bakery coffee "
+    "entrance exit north south east west level lobby security holiday sale "
+    "refund return kids play area pets wheelchair stroller rental charging "
+    "station wifi information desk"
+).split()
+BACKENDS = ("exact", "local_index", "ivf", "int8", "binary", "hybrid")
+STORAGE_MODES = ("per_topic", "shared")
+DDL = ("CREATE", "ALTER", "USE", "DROP")
+# slow-importing packages that the first page of the app should not load
+HEAVY_MODULES = (
+    "langchain_core", "langgraph", "langchain_mistralai",
+    "langchain_community", "snowflake.snowpark", "snowflake.cortex",
+)
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import utils.helpers
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def synthetic_documents(n: int, seed: int = 0) -> list[Document]:
+    # each document is shorter than a chunk, so n documents give n chunks
+    rng = random.Random(seed)
+    return [
+        Document(
+            " ".join(rng.choices(VOCABULARY, k=24)) + f" #{i}",
+            metadata={"source": f"doc-{i % 10}", "index": i},
+        )
+        for i in range(n)
+    ]
+
+
+def synthetic_queries(n: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=4)) for _ in range(n)]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Latency percentiles in milliseconds."""
+    samples = sorted(samples)
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, round(p / 100 * (len(samples) - 1)))] * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def timed(func: Callable, args: list) -> list[float]:
+    latencies = []
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_ingest(session: LocalSession, topic: str, size: int) -> dict:
+    ingester = IngestData(session=session, topic=topic)
+    pipeline = IngestPipeline(
+        documents=synthetic_documents(size),
+        text_splitter=ingester.get_text_splitter(),
+        vector_store=ingester.get_vector_store(),
+    )
+    start = time.perf_counter()
+    for _ in pipeline.run():
+        pass
+    elapsed = time.perf_counter() - start
+    chunks = pipeline.stats["added"]
+    return {
+        "size": size,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "chunks_per_s": chunks / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def get_vector_store(
+    session: LocalSession, topic: str, backend: str
+) -> SnowflakeCortexVectorStore:
+    kwargs = {
+        "local_index": backend in ("local_index", "int8", "binary"),
+        "ivf": backend == "ivf",
+        "quantization": backend if backend in ("int8", "binary") else None,
+        "lexical_index": backend == "hybrid",
+        "lexical_threshold": 1.0 if backend == "hybrid" else None,
+    }
+    ingester = IngestData(session=session, topic=topic, vector_store_kwargs=kwargs)
+    vector_store = ingester.get_vector_store()
+    if backend == "ivf":
+        vector_store.build_ivf()
+    return vector_store
+
+
+def bench_hybrid(
+    vector_store: SnowflakeCortexVectorStore, queries: list[str], k: int
+) -> dict:
+    # the query embedding is part of the cost here, since the lexical fast
+    # path exists to skip it
+    result = summarize(timed(lambda q: vector_store.hybrid_search(q, k), queries))
+    fast = sum(vector_store.lexical_fast_path(q, k) is not None for q in queries)
+    result["fast_path_rate"] = fast / len(queries)
+    return result
+
+
+def bench_search(
+    vector_store: SnowflakeCortexVectorStore, queries: list[str], k: int
+) -> dict:
+    # embed up front so that only the search itself is timed
+    embeddings = [vector_store.embeddings.embed_query(q) for q in queries]
+    result = summarize(
+        timed(lambda e: vector_store.similarity_search_by_vector(e, k), embeddings)
+    )
+    start = time.perf_counter()
+    vector_store.similarity_search_batch_by_vector(embeddings, k)
+    result["batch_ms"] = (time.perf_counter() - start) * 1000
+    if vector_store.quantization is not None:
+        result["recall_at_k"] = vector_store.quantization_recall(queries, k)
+    return result
+
+
+def bench_agent(
+    vector_store: SnowflakeCortexVectorStore, queries: list[str], k: int
+) -> dict:
+    agent = Agent(
+        model="local",
+        temperature=0.0,
+        topic=vector_store.topic,
+        vector_store=vector_store,
+        k=k,
+        verbose=False,
+        llm=LocalChatModel(),
+    ).compile(checkpointer=InMemorySaver())
+    # one long conversation, so that history handling is part of the cost
+    config = {"configurable": {"thread_id": "benchmark"}}
+
+    def turn(query: str) -> None:
+        for _ in agent.stream(
+            {"input": query},
+            config,
+            stream_mode=["messages", "updates"],
+        ):
+            pass
+
+    return summarize(timed(turn, queries))
+
+
+def bench_startup(runs: int) -> dict:
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as cwd:
+        # st.secrets needs a secrets file to fall back to its defaults
+        os.makedirs(os.path.join(cwd, ".streamlit"))
+        open(os.path.join(cwd, ".streamlit", "secrets.toml"), "w").close()
+        samples, loaded = [], []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", _IMPORT_PROBE.format(heavy=HEAVY_MODULES)],
+                cwd=cwd,
+                env={**os.environ, "PYTHONPATH": root},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            probe = json.loads(output.strip().splitlines()[-1])
+            samples.append(probe["seconds"])
+            loaded = probe["loaded"]
+    session = LocalSession()
+    try:
+        vector_store = IngestData(session=session, topic="bench_startup").get_vector_store()
+
+        def build(_: int) -> None:
+            Agent(
+                model="local",
+                temperature=0.0,
+                topic=vector_store.topic,
+                vector_store=vector_store,
+                verbose=False,
+                llm=LocalChatModel(),
+            ).compile(checkpointer=InMemorySaver())
+
+        agent_build = summarize(timed(build, list(range(runs))))
+    finally:
+        session.close()
+    return {
+        "import_helpers": {**summarize(samples), "heavy_modules_loaded": loaded},
+        "agent_build": agent_build,
+    }
+
+
+def bench_topics(topics: int) -> list[dict]:
+    results = []
+    for storage in STORAGE_MODES:
+        session = LocalSession()
+        try:
+            history = session.connection.history
+            counts, ddl = [], []
+
+            def create(i: int) -> None:
+                start = len(history)
+                IngestData(
+                    session=session,
+                    topic=f"bench_topic_{i}",
+                    vector_store_kwargs={"storage": storage},
+                ).get_vector_store()
+                statements = history[start:]
+                counts.append(len(statements))
+                ddl.append(sum(s.lstrip().upper().startswith(DDL) for s in statements))
+
+            latency = summarize(timed(create, list(range(topics))))
+        finally:
+            session.close()
+        results.append({
+            "storage": storage,
+            **latency,
+            # the first topic also creates whatever the mode shares
+            "first_statements": counts[0],
+            "statements_per_topic": statistics.mean(counts[1:] or counts),
+            "ddl_per_topic": statistics.mean(ddl[1:] or ddl),
+        })
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--topics", type=int, default=20, help="new topics per storage mode")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    queries = synthetic_queries(args.queries)
+    results: dict = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "ingest": [],
+        "search": [],
+        "agent": None,
+        "topics": bench_topics(args.topics),
+        "startup": bench_startup(args.startup_runs),
+    }
+    for size in args.sizes:
+        session = LocalSession()
+        try:
+            topic = f"bench_{size}"
+            results["ingest"].append(bench_ingest(session, topic, size))
+            for backend in args.backends:
+                vector_store = get_vector_store(session, topic, backend)
+                if backend == "hybrid":
+                    search = bench_hybrid(vector_store, queries, args.k)
+                else:
+                    search = bench_search(vector_store, queries, args.k)
+                results["search"].append({"size": size, "backend": backend, **search})
+            if size == args.sizes[0]:
+                results["agent"] = {
+                    "size": size,
+                    **bench_agent(
+                        get_vector_store(session, topic, "exact"),
+                        queries[:args.turns],
+                        args.k,
+                    ),
+                }
+        finally:
+            session.close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Headless ingestion of DOCX, PDF, Markdown and HTML files into a topic.
+
+    python ingest.py docs/ "faq/*.pdf" --topic whovilleshoppingmall
+
+Snowflake credentials are read from the SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER
+and SNOWFLAKE_PASSWORD environment variables; with ``--local PATH`` a
+SQLite file (rag_helpers.local.LocalSession) is used instead. One JSON
+line per file with its parse and ingest timing is printed as files
+finish, followed by a summary. Progress is kept in a manifest (by default
+``.ingest-<topic>.json``), so re-running the same command after an
+interruption only processes the files that are not done yet.
+"""
+# standard library
+import argparse
+import json
+import os
+import sys
+import time
+# third-party library
+from snowflake.snowpark import Session
+# local
+from rag_helpers.local import LocalSession
+from utils.corpus import IngestManifest, find_files, ingest_files
+from utils.ingest import IngestData
+
+
+def create_session(local: str | None) -> Session:
+    if local is not None:
+        return LocalSession(local)
+    connection_parameters = {
+        "account": os.environ["SNOWFLAKE_ACCOUNT"],
+        "user": os.environ["SNOWFLAKE_USER"],
+        "password": os.environ["SNOWFLAKE_PASSWORD"],
+        "paramstyle": "pyformat",
+    }
+    return Session.builder.configs(connection_parameters).create()
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("--topic", required=True)
+    parser.add_argument("--model", default="e5-base-v2")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    parser.add_argument("--manifest", help="default: .ingest-<topic>.json")
+    parser.add_argument("--storage", choices=("per_topic", "shared"), default="per_topic")
+    parser.add_argument("--local", metavar="PATH", help="ingest into a local SQLite file")
+    args = parser.parse_args(argv)
+
+    paths = find_files(args.paths)
+    manifest = IngestManifest(args.manifest or f".ingest-{args.topic}.json", args.topic)
+    session = create_session(args.local)
+    summary = {"files": len(paths), "done": 0, "failed": 0, "chunks": 0, "new_chunks": 0}
+    start = time.perf_counter()
+    try:
+        ingester = IngestData(
+            session=session,
+            topic=args.topic,
+            model=args.model,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            vector_store_kwargs={"storage": args.storage},
+        )
+        for report in ingest_files(
+            ingester, paths, manifest, args.workers, args.batch_size
+        ):
+            summary[report["status"]] += 1
+            summary["chunks"] += report["chunks"]
+            summary["new_chunks"] += report["new_chunks"]
+            print(json.dumps(report), flush=True)
+    finally:
+        session.close()
+    summary["skipped"] = summary["files"] - summary["done"] - summary["failed"]
+    summary["seconds"] = time.perf_counter() - start
+    print(json.dumps({"summary": summary}), flush=True)
+    return summary
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main()["failed"] else 0)
@@ -0,0 +1,51 @@
+"""
+Move topics from their own database, schema and warehouse into shared storage.
+
+    python migrate.py whovilleshoppingmall faq --drop
+
+Every topic's rows and IVF centroids are copied into the shared table of
+its embedding dimension (see SnowflakeCortexVectorStore's ``storage``) and
+the topic is registered there. Rows already copied are skipped, so an
+interrupted migration can be re-run. With ``--drop`` the per-topic database
+and warehouse are dropped once a topic is copied. Credentials and
+``--local`` work as in ingest.py. One JSON line is printed per topic.
+"""
+# standard library
+import argparse
+import json
+import time
+# local
+from ingest import create_session
+from rag_helpers.vectorstore import migrate_to_shared
+from utils.ingest import IngestData
+
+
+def main(argv: list[str] | None = None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("topics", nargs="+")
+    parser.add_argument("--model", default="e5-base-v2", help="embedding model of the topics")
+    parser.add_argument("--drop", action="store_true", help="drop the per-topic objects")
+    parser.add_argument("--local", metavar="PATH", help="migrate within a local SQLite file")
+    args = parser.parse_args(argv)
+
+    session = create_session(args.local)
+    reports = []
+    try:
+        for topic in args.topics:
+            start = time.perf_counter()
+            # only the embedding model is needed; building the topic's own
+            # store would create it if the topic does not exist
+            data = IngestData(session=session, topic=topic, model=args.model)
+            rows = migrate_to_shared(
+                session.connection, topic, data.embeddings, data.dimensions, drop=args.drop
+            )
+            report = {"topic": topic, "rows": rows, "seconds": time.perf_counter() - start}
+            reports.append(report)
+            print(json.dumps(report), flush=True)
+    finally:
+        session.close()
+    return reports
+
+
+if __name__ == "__main__":
+    main()
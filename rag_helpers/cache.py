@@ -0,0 +1,375 @@
+# standard library
+from array import array
+from collections import OrderedDict
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, TypedDict
+# third-party library
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Lower case, punctuation removed, whitespace collapsed."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed cache for embeddings.
+
+    Keys are derived from (model, dimensions, sha256 of the whitespace
+    normalized text). The first tier is an in-memory LRU bounded by
+    ``max_memory_entries``; the optional second tier is a SQLite file
+    bounded by ``max_disk_bytes`` that evicts least recently used rows.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_memory_entries: int = 10_000,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access "
+                "ON embeddings (last_access);"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> str:
+        normalized = " ".join(text.split())
+        digest = hashlib.sha256(normalized.encode()).hexdigest()
+        return f"{model}:{dimensions}:{digest}"
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            missing = []
+            for key in unique:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+            if missing and self._db is not None:
+                rows = []
+                # stay below SQLite's bound-variable limit
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    rows.extend(self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders});",
+                        chunk,
+                    ).fetchall())
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                if rows:
+                    self._db.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?;",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+                    self._db.commit()
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is None or not items:
+                return
+            now = time.time()
+            rows = []
+            for key, vector in items.items():
+                blob = array("f", vector).tobytes()
+                rows.append((key, blob, len(blob), now))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) "
+                "VALUES (?, ?, ?, ?);",
+                rows,
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings;"
+        ).fetchone()
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        # walk rows from least to most recently used until enough bytes
+        # have been freed
+        freed, stale = 0, []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_access;"
+        ):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?;", stale)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            disk_entries = 0
+            if self._db is not None:
+                (disk_entries,) = self._db.execute(
+                    "SELECT COUNT(*) FROM embeddings;"
+                ).fetchone()
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+
+
+class RetrievalCache:
+    """
+    Semantic cache of retrieval results for a single topic.
+
+    A lookup hits when a cached query embedding has cosine similarity of at
+    least ``threshold`` with the new one and was cached for at least as
+    many results under the same ``scope`` (e.g. a serialized metadata
+    filter), so results retrieved under one filter never answer a query
+    made under another. Entries expire after ``ttl`` seconds, the oldest entry is
+    dropped beyond ``max_entries`` and the whole cache is cleared whenever
+    the vector store reports a new ``version``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float = 3600,
+        max_entries: int = 1024,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._entries: list[tuple[float, int, str | None, list]] = []
+
+    def _expire(self, version: Any) -> None:
+        if version != self._version:
+            self._version = version
+            self._clear()
+            return
+        now = time.monotonic()
+        keep = [i for i, (t, _, _, _) in enumerate(self._entries) if now - t < self.ttl]
+        if len(keep) != len(self._entries):
+            self._embeddings = self._embeddings[keep]
+            self._entries = [self._entries[i] for i in keep]
+
+    def get(
+        self,
+        embedding: list[float],
+        k: int,
+        version: Any = None,
+        scope: str | None = None,
+    ) -> list | None:
+        with self._lock:
+            self._expire(version)
+            if self._entries:
+                query = np.asarray(embedding, dtype=np.float32)
+                query /= np.linalg.norm(query) or 1.0
+                scores = self._embeddings @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    _, cached_k, cached_scope, documents = self._entries[i]
+                    if cached_k >= k and cached_scope == scope:
+                        self.hits += 1
+                        return documents[:k]
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        embedding: list[float],
+        k: int,
+        documents: list,
+        version: Any = None,
+        scope: str | None = None,
+    ) -> None:
+        with self._lock:
+            self._expire(version)
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            if self._entries:
+                self._embeddings = np.vstack([self._embeddings, vector])
+            else:
+                self._embeddings = vector[None, :]
+            self._entries.append((time.monotonic(), k, scope, documents))
+            if len(self._entries) > self.max_entries:
+                # entries are appended in insertion order
+                self._embeddings = self._embeddings[1:]
+                self._entries = self._entries[1:]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+class CachedAnswer(TypedDict):
+    question: str
+    answer: str
+    # content hashes of the chunks the answer was based on
+    sources: list[str]
+
+
+class AnswerCache:
+    """
+    Final answers of a single topic, keyed on the normalized question.
+
+    With ``threshold`` set, a question that misses the exact lookup also
+    matches a cached one whose embedding has at least that cosine
+    similarity. Entries expire after ``ttl`` seconds, the least recently
+    used entry is dropped beyond ``max_entries`` and the whole cache is
+    cleared whenever the vector store reports a new ``version``.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 1024,
+        threshold: float | None = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, CachedAnswer, np.ndarray | None]] = (
+            OrderedDict()
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, version: Any) -> None:
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            return
+        now = time.monotonic()
+        for key in [k for k, (t, _, _) in self._entries.items() if now - t >= self.ttl]:
+            del self._entries[key]
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _similar(self, embedding: list[float]) -> str | None:
+        keys = [k for k, (_, _, v) in self._entries.items() if v is not None]
+        if not keys:
+            return None
+        scores = np.stack([self._entries[k][2] for k in keys]) @ self._normalize(embedding)
+        best = int(scores.argmax())
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def get(
+        self,
+        question: str,
+        version: Any = None,
+        embedding: list[float] | None = None,
+    ) -> CachedAnswer | None:
+        with self._lock:
+            self._expire(version)
+            key = normalize_query(question)
+            if key not in self._entries and self.threshold is not None and embedding is not None:
+                key = self._similar(embedding)
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def put(
+        self,
+        question: str,
+        answer: str,
+        sources: list[str],
+        version: Any = None,
+        embedding: list[float] | None = None,
+    ) -> None:
+        with self._lock:
+            self._expire(version)
+            key = normalize_query(question)
+            vector = self._normalize(embedding) if embedding is not None else None
+            self._entries[key] = (
+                time.monotonic(),
+                CachedAnswer(question=question, answer=answer, sources=list(sources)),
+                vector,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
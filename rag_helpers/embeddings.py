@@ -1,10 +1,25 @@
 # standard library
+from concurrent.futures import ThreadPoolExecutor
+import json
 from typing import Iterable
 # third-party library
 from langchain_core.embeddings import Embeddings
 from pydantic import BaseModel, ConfigDict
-from snowflake.cortex import embed_text_768, embed_text_1024
 from snowflake.snowpark import Session
+# local
+from .cache import EmbeddingCache
+from .executor import run_blocking
+from .metrics import span
+
+MODELS_768 = {
+    "snowflake-arctic-embed-m-v1.5",
+    "snowflake-arctic-embed-m",
+    "e5-base-v2",
+}
+MODELS_1024 = {
+    "snowflake-arctic-embed-l-v2.0",
+    "nv-embed-qa-4",
+}
 
 
 class SnowflakeCortexEmbeddings(BaseModel, Embeddings):
@@ -12,31 +27,115 @@ class SnowflakeCortexEmbeddings(BaseModel, Embeddings):
     session: Session
     model: str = "e5-base-v2"
     dimensions: int = 768
+    # number of texts embedded per SQL statement; 1 disables batching
+    batch_size: int = 64
+    # number of batches allowed in flight at the same time
+    max_concurrency: int = 4
+    # optional content-addressed cache shared by embed_query and
+    # embed_documents
+    cache: EmbeddingCache | None = None
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def _embed(self, text: str) -> list[float]:
-        text = text.replace("'", "\\'")
-        if self.model in {
-            "snowflake-arctic-embed-m-v1.5",
-            "snowflake-arctic-embed-m",
-            "e5-base-v2"
-        }:
-            response = embed_text_768(
-                model=self.model, text=text, session=self.session
-            )
-        elif self.model in {
-            "snowflake-arctic-embed-l-v2.0",
-            "nv-embed-qa-4",
-        }:
-            response = embed_text_1024(
-                model=self.model, text=text, session=self.session
-            )
+        # a batch of one, so that the text is bound as a parameter rather
+        # than spliced into the statement
+        return self._embed_batch([text])[0]
+
+    def _sql_function(self) -> str:
+        if self.model in MODELS_768:
+            return "SNOWFLAKE.CORTEX.EMBED_TEXT_768"
+        elif self.model in MODELS_1024:
+            return "SNOWFLAKE.CORTEX.EMBED_TEXT_1024"
         else:
             raise ValueError(f"The model: {self.model} is not supported.")
-        return response
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        # one statement per batch; the row index keeps the output aligned
+        # with the input regardless of how the warehouse orders the rows
+        values = ", ".join(f"({i}, %(text_{i})s)" for i in range(len(texts)))
+        params = {f"text_{i}": t for i, t in enumerate(texts)}
+        params["model"] = self.model
+        cursor = self.session.connection.cursor()
+        try:
+            cursor.execute(
+                f"""
+                SELECT
+                    column1 AS IDX,
+                    {self._sql_function()}(%(model)s, column2) AS EMBEDDINGS
+                FROM (VALUES {values})
+                ORDER BY IDX;
+                """,
+                params=params,
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        if len(rows) != len(texts):
+            raise RuntimeError(
+                f"Expected {len(texts)} embeddings but received {len(rows)}."
+            )
+        embeddings = [None] * len(texts)
+        for i, e in rows:
+            embeddings[i] = json.loads(e) if isinstance(e, str) else list(e)
+        return embeddings
+
+    def _embed_documents(self, texts: list[str]) -> Iterable[list[float]]:
+        if self.batch_size <= 1:
+            return map(self._embed, texts)
+        texts = list(texts)
+        self._sql_function()  # fail fast on unsupported models
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = map(self._embed_batch, batches)
+            return [e for batch in results for e in batch]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            # executor.map yields in submission order, so the output stays
+            # aligned with ``texts``
+            results = executor.map(self._embed_batch, batches)
+            return [e for batch in results for e in batch]
+
+    def _embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
 
     def embed_documents(self, texts: list[str]) -> Iterable[list[float]]:
-        return map(self._embed, texts)
+        with span("embed", model=self.model) as attributes:
+            texts = list(texts)
+            attributes["texts"] = len(texts)
+            if self.cache is None:
+                return list(self._embed_documents(texts))
+            keys = [EmbeddingCache.key(self.model, self.dimensions, t) for t in texts]
+            found = self.cache.get_many(keys)
+            # embed every distinct missing text once
+            missing = {k: t for k, t in zip(keys, texts) if k not in found}
+            attributes["cache_hits"] = len(texts) - len(missing)
+            if missing:
+                embedded = self._embed_documents(list(missing.values()))
+                new = dict(zip(missing, map(list, embedded)))
+                self.cache.put_many(new)
+                found.update(new)
+            return [found[k] for k in keys]
 
     def embed_query(self, text: str) -> list[float]:
-        return self._embed(text)
+        with span("embed", model=self.model) as attributes:
+            attributes["texts"] = 1
+            if self.cache is None:
+                return self._embed_query(text)
+            key = EmbeddingCache.key(self.model, self.dimensions, text)
+            found = self.cache.get_many([key])
+            attributes["cache_hits"] = len(found)
+            if key not in found:
+                found[key] = list(self._embed_query(text))
+                self.cache.put_many(found)
+            return found[key]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        embeddings = await run_blocking(
+            self.session.connection, self.embed_documents, texts
+        )
+        return list(embeddings)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await run_blocking(self.session.connection, self.embed_query, text)
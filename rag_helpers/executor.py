@@ -0,0 +1,73 @@
+"""
+Dedicated thread pool for blocking Snowflake connector calls.
+
+The async methods of the vector store and embeddings hand their blocking
+work to ``run_blocking`` rather than to the event loop's default executor,
+so connector I/O cannot starve other ``run_in_executor`` users. Each
+(event loop, connection) pair gets its own semaphore, which caps how many
+statements a single connection has in flight at once.
+"""
+# standard library
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import threading
+from typing import Any, Callable, TypeVar
+import weakref
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_max_workers = 16
+_max_concurrency_per_connection = 4
+_executor: ThreadPoolExecutor | None = None
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def configure_executor(
+    max_workers: int = 16, max_concurrency_per_connection: int = 4
+) -> None:
+    """Resize the pool; takes effect for work submitted afterwards."""
+    global _executor, _max_workers, _max_concurrency_per_connection
+    with _lock:
+        _max_workers = max_workers
+        _max_concurrency_per_connection = max_concurrency_per_connection
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _semaphores.clear()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_max_workers, thread_name_prefix="snowflake"
+            )
+        return _executor
+
+
+def _get_semaphore(connection: Any) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _semaphores.setdefault(loop, {})
+        key = id(connection)
+        if key not in per_loop:
+            per_loop[key] = asyncio.Semaphore(_max_concurrency_per_connection)
+        return per_loop[key]
+
+
+async def run_blocking(
+    connection: Any, func: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    """Run ``func`` on the Snowflake pool, bounded per ``connection``."""
+    async with _get_semaphore(connection):
+        loop = asyncio.get_running_loop()
+        # carry context variables (e.g. LangChain callbacks) into the thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await loop.run_in_executor(get_executor(), call)
@@ -0,0 +1,145 @@
+"""
+Metadata filters for SnowflakeCortexVectorStore.
+
+Filters use the usual LangChain/Mongo-style dict syntax::
+
+    {"source": "faq.docx"}
+    {"floor": {"$gte": 2}, "$or": [{"type": "store"}, {"type": "restroom"}]}
+
+``compile_filter`` turns a filter into a SQL predicate over the METADATA
+VARIANT column in which every key and value is a bound parameter, so
+user-supplied filters can never inject SQL. ``match_filter`` evaluates the
+same filter in Python for the local index mirror.
+"""
+# standard library
+from itertools import count
+from typing import Any
+
+_COMPARISONS = {
+    "$eq": "=",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+}
+
+
+def _cast(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, (int, float)):
+        return "FLOAT"
+    if isinstance(value, str):
+        return "STRING"
+    raise ValueError(f"Unsupported filter value: {value!r}")
+
+
+def compile_filter(
+    filter: dict, column: str = "METADATA", prefix: str = "filter"
+) -> tuple[str, dict[str, Any]]:
+    """Return a SQL predicate and the parameters it binds."""
+    params: dict[str, Any] = {}
+    counter = count()
+
+    def bind(value: Any) -> str:
+        name = f"{prefix}_{next(counter)}"
+        params[name] = value
+        return f"%({name})s"
+
+    def compile_field(key: str, condition: Any) -> str:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        clauses = []
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                if not value:
+                    clauses.append("FALSE" if op == "$in" else "TRUE")
+                    continue
+                cast = _cast(value[0])
+                path = bind(key)
+                placeholders = ", ".join(bind(v) for v in value)
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(
+                    f"GET_PATH({column}, {path})::{cast} {negate}IN ({placeholders})"
+                )
+            elif op == "$exists":
+                check = "IS NOT NULL" if value else "IS NULL"
+                clauses.append(f"GET_PATH({column}, {bind(key)}) {check}")
+            elif op in _COMPARISONS:
+                clauses.append(
+                    f"GET_PATH({column}, {bind(key)})::{_cast(value)} "
+                    f"{_COMPARISONS[op]} {bind(value)}"
+                )
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+        return " AND ".join(clauses)
+
+    def compile_node(node: dict) -> str:
+        if not isinstance(node, dict) or not node:
+            raise ValueError(f"Invalid filter: {node!r}")
+        clauses = []
+        for key, value in node.items():
+            if key in ("$and", "$or"):
+                joiner = " AND " if key == "$and" else " OR "
+                clauses.append(
+                    "(" + joiner.join(f"({compile_node(v)})" for v in value) + ")"
+                )
+            elif key.startswith("$"):
+                raise ValueError(f"Unsupported filter operator: {key}")
+            else:
+                clauses.append(compile_field(key, value))
+        return " AND ".join(clauses)
+
+    return compile_node(filter), params
+
+
+def _get_path(metadata: dict, key: str) -> Any:
+    value: Any = metadata
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def match_filter(metadata: dict, filter: dict) -> bool:
+    """Evaluate ``filter`` against a metadata dict in Python."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(match_filter(metadata, f) for f in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(match_filter(metadata, f) for f in condition):
+                return False
+            continue
+        value = _get_path(metadata, key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$exists":
+                ok = (value is not None) == bool(expected)
+            elif op == "$in":
+                ok = value in expected
+            elif op == "$nin":
+                ok = value is not None and value not in expected
+            elif value is None:
+                ok = False
+            elif op == "$eq":
+                ok = value == expected
+            elif op == "$ne":
+                ok = value != expected
+            elif op == "$gt":
+                ok = value > expected
+            elif op == "$gte":
+                ok = value >= expected
+            elif op == "$lt":
+                ok = value < expected
+            elif op == "$lte":
+                ok = value <= expected
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if not ok:
+                return False
+    return True
@@ -0,0 +1,382 @@
+# standard library
+import json
+import os
+import tempfile
+from typing import Any, Literal
+# third-party library
+import numpy as np
+
+
+# candidates per result rescored against the float32 vectors; sign bits
+# rank far more coarsely than int8 codes and need a much longer shortlist
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 32}
+
+
+class NumpyVectorIndex:
+    """
+    In-process mirror of a topic table.
+
+    Embeddings are held as one contiguous, L2-normalized float32 matrix so
+    a cosine top-k is a single matrix-vector product plus an argpartition.
+    When ``path`` is given the matrix is persisted as ``<path>.npy`` (opened
+    memory-mapped on load) next to a ``<path>.json`` sidecar with the texts,
+    metadata and the highest table ID seen, so a restart only pulls new rows.
+
+    With ``quantization`` a compact copy of every vector is kept as well:
+    ``"int8"`` codes with a per-vector scale (4x smaller) or ``"binary"``
+    sign bits (32x smaller). Searches scan the codes for the top
+    ``k * rescore_factor`` candidates and rescore only those against the
+    float32 vectors (see DEFAULT_RESCORE_FACTORS). The float32 matrix then
+    stays on disk, memory-mapped: at ``path``, or in a temporary file
+    without one. New rows are buffered in a float32 tail of at most
+    ``block_size`` rows that is appended to the file when it fills up or
+    the index is saved, so only the codes, the tail and the pages of
+    shortlisted rows need to be resident.
+    """
+
+    # rows scored per block when scanning codes, bounding temporary memory,
+    # and the most rows a quantized index buffers before writing them out
+    block_size = 4096
+
+    def __init__(
+        self,
+        dimensions: int,
+        path: str | None = None,
+        quantization: Literal["int8", "binary"] | None = None,
+        rescore_factor: int | None = None,
+    ) -> None:
+        if quantization not in (None, "int8", "binary"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.dimensions = dimensions
+        self.path = path
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS.get(quantization, 1)
+        self._codes, self._scales = self.quantize(np.empty((0, dimensions), np.float32))
+        self.last_id = -1
+        self.uuids: list[str] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict] = []
+        # unquantized: every row, in memory; quantized: the rows written to
+        # the matrix file, memory-mapped, followed by the rows in _tail
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._tail = np.empty((0, dimensions), dtype=np.float32)
+        self._size = 0
+        self._tempdir: tempfile.TemporaryDirectory | None = None
+        if quantization is not None and path is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="vector-index-")
+        if path is not None and os.path.exists(f"{path}.npy"):
+            self.load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """All vectors; for a quantized index this reads the whole matrix
+        file into memory, see ``vectors``."""
+        if self.quantization is None:
+            return self._matrix[:self._size]
+        return self.vectors(np.arange(self._size))
+
+    def vectors(self, rows: Any) -> np.ndarray:
+        """Float32 vectors of the given row positions."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.quantization is None:
+            return self._matrix[rows]
+        written = len(self._matrix)
+        on_disk = rows < written
+        vectors = np.empty((len(rows), self.dimensions), dtype=np.float32)
+        vectors[on_disk] = self._matrix[rows[on_disk]]
+        vectors[~on_disk] = self._tail[rows[~on_disk] - written]
+        return vectors
+
+    @property
+    def _matrix_file(self) -> str:
+        if self._tempdir is not None:
+            return os.path.join(self._tempdir.name, "matrix.npy")
+        return f"{self.path}.npy"
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def quantize(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Codes and per-vector scales of normalized ``vectors``."""
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), np.float32)
+        return np.empty((len(vectors), 0), np.int8), np.empty(len(vectors), np.float32)
+
+    def _reserve(self, n: int) -> None:
+        # grow geometrically so repeated small appends stay amortized O(1)
+        needed = self._size + n
+        if self.quantization is None:
+            if needed > self._matrix.shape[0] or not self._matrix.flags.writeable:
+                capacity = max(needed, 2 * self._matrix.shape[0], 64)
+                matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+                matrix[:self._size] = self._matrix[:self._size]
+                self._matrix = matrix
+        if needed <= len(self._scales):
+            return
+        capacity = max(needed, 2 * len(self._scales), 64)
+        codes = np.empty((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+        codes[:self._size] = self._codes[:self._size]
+        scales = np.empty(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        self._codes, self._scales = codes, scales
+
+    def _write_matrix(self, rows: np.ndarray | None = None) -> None:
+        """
+        Write the quantized index's float32 vectors (only ``rows`` of them,
+        if given) to a new matrix file, block by block, and map it in place
+        of the old one together with the tail.
+        """
+        rows = np.arange(self._size) if rows is None else rows
+        temporary = f"{self._matrix_file}.tmp.npy"
+        out = np.lib.format.open_memmap(
+            temporary, mode="w+", dtype=np.float32, shape=(len(rows), self.dimensions)
+        )
+        for start in range(0, len(rows), self.block_size):
+            out[start:start + self.block_size] = self.vectors(rows[start:start + self.block_size])
+        out.flush()
+        del out
+        os.replace(temporary, self._matrix_file)
+        self._matrix = np.load(self._matrix_file, mmap_mode="r")
+        self._tail = np.empty((0, self.dimensions), dtype=np.float32)
+
+    def add(
+        self,
+        ids: list[int],
+        uuids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+        embeddings: list[list[float]],
+    ) -> None:
+        if not ids:
+            return
+        self._reserve(len(ids))
+        vectors = self.normalize(embeddings)
+        rows = slice(self._size, self._size + len(ids))
+        if self.quantization is None:
+            self._matrix[rows] = vectors
+        else:
+            self._tail = np.concatenate([self._tail, vectors])
+        self._codes[rows], self._scales[rows] = self.quantize(vectors)
+        self._size += len(ids)
+        self.uuids.extend(uuids)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self.last_id = max(self.last_id, max(ids))
+        if len(self._tail) >= self.block_size:
+            self._write_matrix()
+
+    def remove(self, uuids: list[str]) -> None:
+        removed = set(uuids)
+        keep = [i for i, u in enumerate(self.uuids) if u not in removed]
+        if len(keep) == self._size:
+            return
+        if self.quantization is None:
+            self._matrix = np.ascontiguousarray(self.matrix[keep])
+        else:
+            self._write_matrix(np.asarray(keep, dtype=np.int64))
+        self._codes = np.ascontiguousarray(self._codes[:self._size][keep])
+        self._scales = np.ascontiguousarray(self._scales[:self._size][keep])
+        self._size = len(keep)
+        self.uuids = [self.uuids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(self._size, dtype=np.float32)
+        if self.quantization == "binary":
+            bits = np.packbits(query > 0)
+            for start in range(0, self._size, self.block_size):
+                block = self._codes[start:min(start + self.block_size, self._size)]
+                end = start + len(block)
+                hamming = _POPCOUNT[block ^ bits].sum(axis=1, dtype=np.int32)
+                scores[start:end] = 1 - 2 * hamming / self.dimensions
+            return scores
+        for start in range(0, self._size, self.block_size):
+            block = self._codes[start:min(start + self.block_size, self._size)]
+            end = start + len(block)
+            scores[start:end] = (block.astype(np.float32) @ query) * self._scales[start:end]
+        return scores
+
+    def search(
+        self,
+        embedding: list[float],
+        k: int,
+        mask: np.ndarray | None = None,
+        exact: bool = False,
+    ) -> list[tuple[int, float]]:
+        if self._size == 0 or k <= 0:
+            return []
+        query = self.normalize(embedding)
+        approximate = self.quantization is not None and not exact
+        scores = self._approximate_scores(query) if approximate else self.matrix @ query
+        if mask is not None:
+            # rows excluded by a filter can never make the top-k
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return []
+        k = min(k, self._size)
+        if approximate:
+            # shortlist on the codes, then rescore exactly
+            n = min(k * self.rescore_factor, len(scores) if mask is None else int(mask.sum()))
+            # sorted, so that a memory-mapped matrix is read in file order
+            shortlist = np.sort(np.argpartition(-scores, n - 1)[:n])
+            exact_scores = self.vectors(shortlist) @ query
+            top = np.argpartition(-exact_scores, k - 1)[:k]
+            top = top[np.argsort(-exact_scores[top])]
+            return [(int(shortlist[i]), float(exact_scores[i])) for i in top]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def recall(self, queries: list[list[float]], k: int) -> float:
+        """Mean recall@k of the quantized search against exact search."""
+        if not queries or self._size == 0:
+            return 1.0
+        total = 0.0
+        for query in queries:
+            exact = {i for i, _ in self.search(query, k, exact=True)}
+            found = {i for i, _ in self.search(query, k)}
+            total += len(exact & found) / len(exact)
+        return total / len(queries)
+
+    def load(self) -> None:
+        with open(f"{self.path}.json") as f:
+            state: dict[str, Any] = json.load(f)
+        matrix = np.load(f"{self.path}.npy", mmap_mode="r")
+        if matrix.shape != (len(state["uuids"]), self.dimensions):
+            # interrupted between writing the matrix and its sidecar: start
+            # over, the next refresh pulls every row again
+            return
+        self._matrix = matrix
+        self._size = matrix.shape[0]
+        if self.quantization is not None:
+            # codes are rebuilt block by block, so the float32 matrix is
+            # streamed through once rather than loaded whole
+            codes, scales = zip(*(
+                self.quantize(np.asarray(self._matrix[start:start + self.block_size]))
+                for start in range(0, self._size, self.block_size)
+            )) if self._size else ([self._codes], [self._scales])
+            self._codes = np.concatenate(codes)
+            self._scales = np.concatenate(scales)
+            self._tail = np.empty((0, self.dimensions), dtype=np.float32)
+        else:
+            # no codes, but _reserve expects them as long as the matrix
+            self._codes, self._scales = self.quantize(np.empty((self._size, 0), np.float32))
+        self.last_id = state["last_id"]
+        self.uuids = state["uuids"]
+        self.texts = state["texts"]
+        self.metadatas = state["metadatas"]
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        # write to temporary files first so a crash never leaves a torn
+        # matrix; load() discards one that disagrees with its sidecar
+        if self.quantization is not None:
+            if len(self._tail) or len(self._matrix) != self._size:
+                self._write_matrix()
+        else:
+            np.save(f"{self.path}.tmp.npy", self.matrix)
+        with open(f"{self.path}.tmp.json", "w") as f:
+            json.dump(
+                {
+                    "last_id": self.last_id,
+                    "uuids": self.uuids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+            )
+        if self.quantization is None:
+            os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    max_iter: int = 25,
+    init: np.ndarray | None = None,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over L2-normalized vectors.
+
+    Returns the normalized centroids and each vector's cluster label.
+    ``init`` warm-starts from existing centroids, which keeps cluster IDs
+    stable when rebalancing.
+    """
+    vectors = NumpyVectorIndex.normalize(vectors)
+    n_clusters = min(n_clusters, len(vectors))
+    rng = np.random.default_rng(seed)
+    if init is not None and init.shape == (n_clusters, vectors.shape[1]):
+        centroids = NumpyVectorIndex.normalize(init)
+    else:
+        centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)]
+    labels = np.full(len(vectors), -1)
+    for _ in range(max_iter):
+        scores = vectors @ centroids.T
+        new_labels = scores.argmax(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            # re-seed empty clusters with the points farthest from their centroid
+            farthest = np.argsort(scores[np.arange(len(vectors)), labels])[:len(empty)]
+            sums[empty] = vectors[farthest]
+        centroids = NumpyVectorIndex.normalize(sums)
+    return centroids, labels
+
+
+def maximal_marginal_relevance(
+    query: list[float],
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """
+    Pick ``k`` candidate indices that balance similarity to ``query``
+    against similarity to the candidates already picked.
+
+    Pairwise similarities are computed once as a single matrix product and
+    each step only updates a running max, so selection is O(k * n).
+    """
+    if len(candidates) == 0 or k <= 0:
+        return []
+    candidates = NumpyVectorIndex.normalize(candidates)
+    relevance = candidates @ NumpyVectorIndex.normalize(query)
+    pairwise = candidates @ candidates.T
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected: list[int] = []
+    for _ in range(min(k, len(candidates))):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(scores.argmax())
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return selected
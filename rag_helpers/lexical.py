@@ -0,0 +1,148 @@
+# standard library
+from collections import Counter
+import heapq
+import math
+import re
+from typing import Callable, Iterable
+# third-party library
+from langchain_core.documents import Document
+
+_TOKEN = re.compile(r"\w+")
+# dropped from documents and queries alike; they carry no signal for FAQ lookups
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on "
+    "or the there to what when where which who why will with you your".split()
+)
+
+
+def _stem(token: str) -> str:
+    # fold plain plurals ("restrooms", "stores") onto the singular
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(t) for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index over the chunk texts of a topic table.
+
+    Postings map each term to ``{slot: term frequency}``; a slot is the
+    position of a chunk in ``texts``/``metadatas``. Removed chunks leave an
+    empty slot behind, so slots stay valid while the index is in use.
+    Scores are Okapi BM25 with the usual ``k1``/``b`` parameters.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.last_id = -1
+        self.uuids: list[str | None] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict] = []
+        self._postings: dict[str, dict[int, int]] = {}
+        self._lengths: list[int] = []
+        self._slots: dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(
+        self,
+        ids: list[int],
+        uuids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+    ) -> None:
+        for u, t, m in zip(uuids, texts, metadatas):
+            slot = len(self.texts)
+            terms = tokenize(t)
+            for term, tf in Counter(terms).items():
+                self._postings.setdefault(term, {})[slot] = tf
+            self.uuids.append(u)
+            self.texts.append(t)
+            self.metadatas.append(m)
+            self._lengths.append(len(terms))
+            self._slots[u] = slot
+            self._total_length += len(terms)
+        if ids:
+            self.last_id = max(self.last_id, max(ids))
+
+    def remove(self, uuids: Iterable[str]) -> None:
+        for u in uuids:
+            slot = self._slots.pop(u, None)
+            if slot is None:
+                continue
+            for term in set(tokenize(self.texts[slot])):
+                postings = self._postings[term]
+                del postings[slot]
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths[slot]
+            self._lengths[slot] = 0
+            self.uuids[slot] = None
+            self.texts[slot] = ""
+            self.metadatas[slot] = {}
+
+    def idf(self, term: str) -> float:
+        n = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self) - n + 0.5) / (n + 0.5))
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        accept: Callable[[int], bool] | None = None,
+    ) -> tuple[list[tuple[int, float]], float]:
+        """
+        Top-``k`` ``(slot, score)`` pairs for ``query``, optionally limited
+        to slots ``accept`` returns True for, and the share of the query's
+        IDF weight the best hit contains (1.0 when it matches every term).
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._slots:
+            return [], 0.0
+        average = self._total_length / len(self)
+        scores: dict[int, float] = {}
+        matched: dict[int, float] = {}
+        weights = {term: self.idf(term) for term in terms}
+        for term, idf in weights.items():
+            for slot, tf in self._postings.get(term, {}).items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[slot] / average)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[slot] = matched.get(slot, 0.0) + idf
+        if accept is not None:
+            scores = {slot: s for slot, s in scores.items() if accept(slot)}
+        hits = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        total = sum(weights.values())
+        coverage = matched[hits[0][0]] / total if hits and total else 0.0
+        return hits, coverage
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[Document]], k: int, constant: int = 60
+) -> list[Document]:
+    """
+    Merge ranked lists by summing ``1 / (constant + rank)`` per document;
+    documents are identified by their text. The fused score replaces
+    ``metadata["score"]``.
+    """
+    scores: dict[str, float] = {}
+    documents: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.page_content
+            scores[key] = scores.get(key, 0.0) + 1 / (constant + rank)
+            documents.setdefault(key, document)
+    fused = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [
+        Document(
+            documents[key].page_content,
+            metadata={**documents[key].metadata, "score": score},
+        )
+        for key, score in fused
+    ]
@@ -0,0 +1,313 @@
+"""
+Local stand-in for a Snowpark session.
+
+``LocalSession`` mimics the small part of the Snowflake connector that the
+rest of the app relies on (``session.connection.cursor().execute(...)`` with
+pyformat parameters) on top of an in-memory SQLite database. Cortex embedding
+functions are replaced by a deterministic hashed bag-of-words embedding, so
+everything can be exercised offline without credentials.
+"""
+# standard library
+from array import array
+import functools
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import uuid
+from typing import Any, Iterator
+# third-party library
+import numpy as np
+from snowflake.snowpark import Session
+
+_IDENTIFIER_PARAM = re.compile(r"IDENTIFIER\(\s*%\((\w+)\)s\s*\)", re.IGNORECASE)
+_VECTOR_CAST = re.compile(
+    r"(\[[^\]]*\]|%\(\w+\)s|\w+\([^()]*\)|[\w.]+)\s*::\s*VECTOR\(\s*FLOAT\s*,\s*(?:\d+|%\(\w+\)s)\s*\)",
+    re.IGNORECASE,
+)
+_VECTOR_TYPE = re.compile(
+    r"VECTOR\(\s*FLOAT\s*,\s*(?:\d+|%\(\w+\)s)\s*\)", re.IGNORECASE
+)
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+_SCALAR_CAST = re.compile(r"::\s*(STRING|VARCHAR|FLOAT|BOOLEAN)\b", re.IGNORECASE)
+# SQLite has no QUALIFY: a top-level SELECT ... QUALIFY expr [ORDER BY ...]
+# is rewritten to filter on the expression from an outer query
+_QUALIFY = re.compile(
+    r"^\s*SELECT\b(.*?)\bQUALIFY\b(.*?)(\bORDER\s+BY\b[^()]*?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_ADD_COLUMN = re.compile(
+    r"^\s*ALTER\s+TABLE\s+(.+?)\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+(.+?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_CREATE_OR_REPLACE_TABLE = re.compile(
+    r"^\s*CREATE\s+OR\s+REPLACE\s+TABLE\s+(\S+)", re.IGNORECASE
+)
+_SWAP = re.compile(
+    r"^\s*ALTER\s+TABLE\s+(\S+)\s+SWAP\s+WITH\s+(\S+?)\s*;?\s*$", re.IGNORECASE
+)
+_NOOP_STATEMENTS = re.compile(
+    r"^\s*((CREATE(\s+OR\s+REPLACE)?|DROP)\s+(DATABASE|SCHEMA|WAREHOUSE)|USE\s"
+    r"|ALTER\s+(WAREHOUSE|SESSION)"
+    r"|ALTER\s+TABLE\s+.*\sCLUSTER\s+BY\s)",
+    re.IGNORECASE,
+)
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    """Deterministic, L2-normalized hashed bag-of-words embedding."""
+    vector = [0.0] * dimensions
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "little")
+        vector[h % dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [x / norm for x in vector]
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_vector(text: str) -> bytes:
+    # SQLite re-evaluates casts of joined subquery columns for every row
+    return array("f", json.loads(text)).tobytes()
+
+
+def _to_vector(value: Any) -> bytes | None:
+    if value is None or isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return _parse_vector(value)
+    return array("f", value).tobytes()
+
+
+def _from_vector(value: bytes) -> list[float]:
+    return array("f", value).tolist()
+
+
+def _cosine_similarity(a: bytes, b: bytes) -> float | None:
+    if a is None or b is None:
+        return None
+    x, y = np.frombuffer(a, dtype=np.float32), np.frombuffer(b, dtype=np.float32)
+    norm = float(np.linalg.norm(x) * np.linalg.norm(y))
+    return float(x @ y) / norm if norm else 0.0
+
+
+def _get_path(value: str | None, path: str) -> Any:
+    if value is None:
+        return None
+    value = json.loads(value)
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _quote_identifier(name: str) -> str:
+    # a single SQLite database stands in for every database and schema, so
+    # qualified names resolve to the bare table name
+    if re.search(r"(^|\.)INFORMATION_SCHEMA\.COLUMNS$", str(name), re.IGNORECASE):
+        return "INFORMATION_SCHEMA_COLUMNS"
+    name = str(name).rsplit(".", 1)[-1]
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _adapt(value: Any) -> Any:
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value)
+    return value
+
+
+class LocalCursor:
+    def __init__(self, connection: "LocalConnection") -> None:
+        self.connection = connection
+        self._rows: list[tuple] = []
+        self.description = None
+        self.rowcount = -1
+
+    def translate(self, command: str, params: dict) -> str:
+        command = _IDENTIFIER_PARAM.sub(
+            lambda m: _quote_identifier(params[m.group(1)]), command
+        )
+        command = re.sub(r"::\s*ARRAY\b", "", command, flags=re.IGNORECASE)
+        command = _VECTOR_CAST.sub(
+            lambda m: "TO_VECTOR({})".format(
+                "'{}'".format(m.group(1)) if m.group(1).startswith("[") else m.group(1)
+            ),
+            command,
+        )
+        command = _VECTOR_TYPE.sub("BLOB", command)
+        command = _SCALAR_CAST.sub("", command)
+        command = re.sub(
+            r"INFORMATION_SCHEMA\.COLUMNS", "INFORMATION_SCHEMA_COLUMNS",
+            command, flags=re.IGNORECASE,
+        )
+        command = re.sub(
+            r"INTEGER\s+AUTOINCREMENT(\s+START\s+\d+\s+INCREMENT\s+\d+)?",
+            "INTEGER PRIMARY KEY AUTOINCREMENT",
+            command, flags=re.IGNORECASE,
+        )
+        command = re.sub(
+            r"DEFAULT\s+UUID_STRING\(\)", "DEFAULT (lower(hex(randomblob(16))))",
+            command, flags=re.IGNORECASE,
+        )
+        command = re.sub(r"SNOWFLAKE\.CORTEX\.", "", command, flags=re.IGNORECASE)
+        command = _NAMED_PARAM.sub(r":\1", command)
+        return command
+
+    def execute(self, command: str, params: dict | None = None) -> "LocalCursor":
+        params = dict(params or {})
+        self.connection.history.append(command)
+        self._rows, self.description, self.rowcount = [], None, -1
+        if _NOOP_STATEMENTS.match(command):
+            return self
+        sql = self.translate(command, params)
+        if match := _ADD_COLUMN.match(sql):
+            # SQLite has no ADD COLUMN IF NOT EXISTS
+            table, column, _ = match.groups()
+            with self.connection.lock:
+                columns = self.connection.db.execute(
+                    f"PRAGMA table_info({table});"
+                ).fetchall()
+            if any(c[1].upper() == column.upper() for c in columns):
+                return self
+            sql = _ADD_COLUMN.sub(r"ALTER TABLE \1 ADD COLUMN \2 \3;", sql)
+        if match := _SWAP.match(sql):
+            a, b = match.groups()
+            with self.connection.lock:
+                for statement in (
+                    f"ALTER TABLE {a} RENAME TO __swap;",
+                    f"ALTER TABLE {b} RENAME TO {a};",
+                    f"ALTER TABLE __swap RENAME TO {b};",
+                ):
+                    self.connection.db.execute(statement)
+            return self
+        if match := _CREATE_OR_REPLACE_TABLE.match(sql):
+            with self.connection.lock:
+                self.connection.db.execute(f"DROP TABLE IF EXISTS {match.group(1)};")
+            sql = re.sub(r"\s+OR\s+REPLACE", "", sql, count=1, flags=re.IGNORECASE)
+        qualify = _QUALIFY.match(sql)
+        if qualify:
+            columns, condition, order_by = qualify.groups()
+            # the condition may refer to select-list aliases, as in Snowflake
+            sql = (
+                f"SELECT * FROM (SELECT *, ({condition}) AS __QUALIFY "
+                f"FROM (SELECT {columns})) WHERE __QUALIFY {order_by or ''};"
+            )
+        with self.connection.lock:
+            cursor = self.connection.db.execute(
+                sql, {k: _adapt(v) for k, v in params.items()}
+            )
+            # drop the helper column of an emulated QUALIFY
+            width = len(cursor.description or ()) - (1 if qualify else 0)
+            self.description = cursor.description and cursor.description[:width]
+            self._rows = [
+                tuple(_from_vector(v) if isinstance(v, bytes) else v for v in row[:width])
+                for row in cursor.fetchall()
+            ]
+            self.rowcount = cursor.rowcount if cursor.rowcount >= 0 else len(self._rows)
+        return self
+
+    def fetchall(self) -> list[tuple]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self) -> tuple | None:
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self) -> None:
+        self._rows = []
+
+    def __iter__(self) -> Iterator[tuple]:
+        while self._rows:
+            yield self._rows.pop(0)
+
+
+class LocalConnection:
+    def __init__(self, path: str = ":memory:") -> None:
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # every stand-in database is its own "account"
+        self.account = f"local-{uuid.uuid4()}"
+        self.lock = threading.Lock()
+        # every statement sent through a cursor, in execution order
+        self.history: list[str] = []
+        self.db.create_function("TO_VECTOR", 1, _to_vector, deterministic=True)
+        self.db.create_function(
+            "VECTOR_COSINE_SIMILARITY", 2, _cosine_similarity, deterministic=True
+        )
+        self.db.create_function(
+            "EMBED_TEXT_768", 2,
+            lambda model, text: _to_vector(fake_embedding(text, 768)),
+            deterministic=True,
+        )
+        self.db.create_function(
+            "EMBED_TEXT_1024", 2,
+            lambda model, text: _to_vector(fake_embedding(text, 1024)),
+            deterministic=True,
+        )
+        self.db.create_function("UUID_STRING", 0, lambda: str(uuid.uuid4()))
+        self.db.create_function(
+            "SHA2", 2,
+            lambda text, bits: hashlib.new(f"sha{bits}", text.encode()).hexdigest(),
+            deterministic=True,
+        )
+        self.db.create_function("PARSE_JSON", 1, lambda x: x, deterministic=True)
+        self.db.create_function("TRY_PARSE_JSON", 1, lambda x: x, deterministic=True)
+        self.db.create_function("GET_PATH", 2, _get_path, deterministic=True)
+        self.db.create_function("CURRENT_SCHEMA", 0, lambda: "PUBLIC")
+        self.db.execute(
+            """
+            CREATE TEMP VIEW INFORMATION_SCHEMA_COLUMNS AS
+            SELECT
+                'PUBLIC' AS TABLE_SCHEMA,
+                UPPER(m.name) AS TABLE_NAME,
+                UPPER(p.name) AS COLUMN_NAME,
+                UPPER(p.type) AS DATA_TYPE
+            FROM sqlite_master m JOIN pragma_table_info(m.name) p
+            WHERE m.type = 'table';
+            """
+        )
+        self.db.create_function("TO_VARCHAR", 1, lambda x: x, deterministic=True)
+
+    def cursor(self) -> LocalCursor:
+        return LocalCursor(self)
+
+    def commit(self) -> None:
+        with self.lock:
+            self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def is_closed(self) -> bool:
+        try:
+            self.db.execute("SELECT 1;")
+        except sqlite3.ProgrammingError:
+            return True
+        return False
+
+
+class LocalSession(Session):
+    """Offline drop-in for ``snowflake.snowpark.Session``."""
+
+    def __init__(self, path: str = ":memory:") -> None:
+        # deliberately skip Session.__init__, which needs a live server
+        self._local_connection = LocalConnection(path)
+
+    @property
+    def connection(self) -> LocalConnection:
+        return self._local_connection
+
+    def close(self) -> None:
+        self._local_connection.close()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}>"
+
+    __str__ = __repr__
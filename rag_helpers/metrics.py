@@ -0,0 +1,195 @@
+"""
+Timing spans and counters for the hot paths of the app.
+
+Embedding calls, vector SQL, LLM calls and tool calls are wrapped in
+``span``. Each span feeds a ``<name>_duration_seconds`` histogram and, for
+every numeric attribute set on it (rows, texts, tokens, ...), a
+``<name>_<attribute>_total`` counter. ``render_prometheus`` exposes
+everything in the Prometheus text format. Hooks registered with
+``add_hook`` receive every finished span, e.g. ``opentelemetry_hook`` to
+forward them to an OpenTelemetry tracer. Spans finished inside a ``turn``
+block are also collected for a per-turn breakdown.
+"""
+# standard library
+from contextlib import contextmanager
+from contextvars import ContextVar
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Iterator, TypedDict
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+_PREFIX = "rag_"
+
+_Key = tuple[str, tuple[tuple[str, str], ...]]
+
+
+class SpanRecord(TypedDict):
+    name: str
+    labels: dict[str, str]
+    attributes: dict[str, Any]
+    start: float
+    duration: float
+
+
+SpanHook = Callable[[SpanRecord], None]
+
+_lock = threading.Lock()
+_counters: dict[_Key, float] = {}
+# bucket counts followed by the sum and the count of observations
+_histograms: dict[_Key, list[float]] = {}
+_hooks: list[SpanHook] = []
+_turn: ContextVar[list[SpanRecord] | None] = ContextVar("metrics_turn", default=None)
+
+
+def _key(name: str, labels: dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.setdefault(key, [0.0] * (len(_BUCKETS) + 2))
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[dict[str, Any]]:
+    """
+    Time the block. The yielded dict takes attributes such as ``rows``;
+    numeric ones are also added to counters.
+    """
+    attributes: dict[str, Any] = {}
+    start = time.time()
+    began = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - began
+        observe(f"{name}_duration_seconds", duration, **labels)
+        for attribute, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                inc(f"{name}_{attribute}_total", value, **labels)
+        record = SpanRecord(
+            name=name,
+            labels={k: str(v) for k, v in labels.items()},
+            attributes=attributes,
+            start=start,
+            duration=duration,
+        )
+        records = _turn.get()
+        if records is not None:
+            records.append(record)
+        for hook in list(_hooks):
+            hook(record)
+
+
+@contextmanager
+def turn() -> Iterator[list[SpanRecord]]:
+    """Collect the spans finished in this context, including worker threads
+    that copy it (LangGraph nodes, ``run_blocking``)."""
+    records: list[SpanRecord] = []
+    token = _turn.set(records)
+    try:
+        yield records
+    finally:
+        _turn.reset(token)
+
+
+def breakdown(records: list[SpanRecord]) -> list[dict[str, Any]]:
+    """Count, total seconds and summed numeric attributes per span name."""
+    rows: dict[str, dict[str, Any]] = {}
+    for record in records:
+        row = rows.setdefault(record["name"], {"span": record["name"], "count": 0, "seconds": 0.0})
+        row["count"] += 1
+        row["seconds"] += record["duration"]
+        for attribute, value in record["attributes"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[attribute] = row.get(attribute, 0) + value
+    return sorted(rows.values(), key=lambda r: -r["seconds"])
+
+
+def add_hook(hook: SpanHook) -> None:
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: SpanHook) -> None:
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def opentelemetry_hook(tracer: Any) -> SpanHook:
+    """Forward finished spans to an ``opentelemetry.trace.Tracer``."""
+    def hook(record: SpanRecord) -> None:
+        start = int(record["start"] * 1e9)
+        otel_span = tracer.start_span(
+            record["name"],
+            start_time=start,
+            attributes={**record["labels"], **record["attributes"]},
+        )
+        otel_span.end(end_time=start + int(record["duration"] * 1e9))
+    return hook
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """All counters and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, list(v)) for k, v in _histograms.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {_PREFIX}{name} counter")
+        lines.append(f"{_PREFIX}{name}{_labels(labels)} {value:g}")
+    for (name, labels), histogram in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {_PREFIX}{name} histogram")
+        for bound, count in zip(_BUCKETS, histogram):
+            le = "+Inf" if bound == math.inf else f"{bound:g}"
+            lines.append(f"{_PREFIX}{name}_bucket{_labels(labels, le=le)} {count:g}")
+        lines.append(f"{_PREFIX}{name}_sum{_labels(labels)} {histogram[-2]:g}")
+        lines.append(f"{_PREFIX}{name}_count{_labels(labels)} {histogram[-1]:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> None:
+    """Atomically write ``render_prometheus`` to ``path``, e.g. for the
+    node_exporter textfile collector."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+        f.write(render_prometheus())
+    os.replace(f.name, path)
@@ -0,0 +1,83 @@
+# standard library
+import threading
+import time
+from typing import Callable
+# third-party library
+from snowflake.snowpark import Session
+
+
+class SessionPool:
+    """
+    Process-wide pool of Snowpark sessions.
+
+    Connector connections are thread-safe, so leases are not exclusive:
+    ``acquire`` hands out the healthy session with the fewest active leases
+    and only opens a new one while every existing session is leased and the
+    pool is below ``max_size``. A session that has been idle for longer
+    than ``health_check_interval`` seconds is probed with ``SELECT 1`` and
+    replaced if the probe fails or its connection was closed.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Session],
+        max_size: int = 4,
+        health_check_interval: float = 300,
+    ) -> None:
+        self.factory = factory
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self._leases: dict[Session, int] = {}
+        self._last_used: dict[Session, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._leases)
+
+    def _is_healthy(self, session: Session) -> bool:
+        connection = session.connection
+        if connection.is_closed():
+            return False
+        if time.monotonic() - self._last_used[session] < self.health_check_interval:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchall()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, session: Session) -> None:
+        del self._leases[session]
+        del self._last_used[session]
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> Session:
+        with self._lock:
+            for session in sorted(self._leases, key=self._leases.get):
+                if self._leases[session] > 0 and len(self._leases) < self.max_size:
+                    break
+                if self._is_healthy(session):
+                    self._leases[session] += 1
+                    self._last_used[session] = time.monotonic()
+                    return session
+                self._discard(session)
+            session = self.factory()
+            self._leases[session] = 1
+            self._last_used[session] = time.monotonic()
+            return session
+
+    def release(self, session: Session) -> None:
+        with self._lock:
+            if session in self._leases:
+                self._leases[session] = max(self._leases[session] - 1, 0)
+                self._last_used[session] = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            for session in list(self._leases):
+                self._discard(session)
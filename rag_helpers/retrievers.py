@@ -0,0 +1,117 @@
+# standard library
+import json
+from typing import Literal
+# third-party library
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+# local
+from .cache import RetrievalCache
+
+
+class SemanticCacheRetriever(BaseRetriever):
+    """
+    Retriever that answers near-duplicate queries from a RetrievalCache
+    instead of going back to the vector store; without a ``cache`` every
+    query goes to the vector store. ``filter`` is passed on to
+    the vector store's metadata filter; ``search_type="mmr"`` selects
+    ``k`` diverse results out of ``fetch_k`` candidates and
+    ``search_type="hybrid"`` fuses ``fetch_k`` keyword and vector hits,
+    answering confident keyword hits before the query is even embedded.
+    """
+
+    vector_store: VectorStore
+    cache: RetrievalCache | None = None
+    k: int = 5
+    filter: dict | None = None
+    search_type: Literal["similarity", "mmr", "hybrid"] = "similarity"
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    @property
+    def scope(self) -> str | None:
+        if self.search_type == "mmr":
+            return json.dumps(
+                [self.filter, self.fetch_k, self.lambda_mult], sort_keys=True
+            )
+        if self.search_type == "hybrid":
+            return json.dumps(["hybrid", self.filter, self.fetch_k], sort_keys=True)
+        return json.dumps(self.filter, sort_keys=True) if self.filter else None
+
+    def _search(self, query: str, embedding: list[float]) -> list[Document]:
+        if self.search_type == "hybrid":
+            return self.vector_store.hybrid_search_by_vector(
+                query, embedding, self.k, fetch_k=self.fetch_k, filter=self.filter
+            )
+        if self.search_type == "mmr":
+            return self.vector_store.max_marginal_relevance_search_by_vector(
+                embedding, self.k, fetch_k=self.fetch_k,
+                lambda_mult=self.lambda_mult, filter=self.filter,
+            )
+        return self.vector_store.similarity_search_by_vector(
+            embedding, self.k, filter=self.filter
+        )
+
+    async def _asearch(self, query: str, embedding: list[float]) -> list[Document]:
+        if self.search_type == "hybrid":
+            return await self.vector_store.ahybrid_search_by_vector(
+                query, embedding, self.k, fetch_k=self.fetch_k, filter=self.filter
+            )
+        if self.search_type == "mmr":
+            return await self.vector_store.amax_marginal_relevance_search_by_vector(
+                embedding, self.k, fetch_k=self.fetch_k,
+                lambda_mult=self.lambda_mult, filter=self.filter,
+            )
+        return await self.vector_store.asimilarity_search_by_vector(
+            embedding, self.k, filter=self.filter
+        )
+
+    def search_by_vector(self, query: str, embedding: list[float]) -> list[Document]:
+        """Results for ``query`` already embedded as ``embedding``."""
+        if self.cache is None:
+            return self._search(query, embedding)
+        version = getattr(self.vector_store, "version", None)
+        documents = self.cache.get(embedding, self.k, version, self.scope)
+        if documents is None:
+            documents = self._search(query, embedding)
+            self.cache.put(embedding, self.k, documents, version, self.scope)
+        return documents
+
+    async def asearch_by_vector(
+        self, query: str, embedding: list[float]
+    ) -> list[Document]:
+        if self.cache is None:
+            return await self._asearch(query, embedding)
+        if hasattr(self.vector_store, "aget_version"):
+            version = await self.vector_store.aget_version()
+        else:
+            version = getattr(self.vector_store, "version", None)
+        documents = self.cache.get(embedding, self.k, version, self.scope)
+        if documents is None:
+            documents = await self._asearch(query, embedding)
+            self.cache.put(embedding, self.k, documents, version, self.scope)
+        return documents
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        if self.search_type == "hybrid":
+            documents = self.vector_store.lexical_fast_path(query, self.k, self.filter)
+            if documents is not None:
+                return documents
+        embedding = self.vector_store.embeddings.embed_query(query)
+        return self.search_by_vector(query, embedding)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        if self.search_type == "hybrid":
+            documents = self.vector_store.lexical_fast_path(query, self.k, self.filter)
+            if documents is not None:
+                return documents
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        return await self.asearch_by_vector(query, embedding)
@@ -1,11 +1,70 @@
 # standard library
+import hashlib
 import json
-from typing import Iterable, Self, Any
+import threading
+import time
+import uuid
+from typing import Iterable, Literal, Self, Any
+import weakref
 # third-party library
+import numpy as np
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
 from snowflake.connector import SnowflakeConnection
+from snowflake.connector.cursor import SnowflakeCursor
+# local
+from .executor import run_blocking
+from .filters import compile_filter, match_filter
+from .metrics import inc, span
+from .index import NumpyVectorIndex, kmeans, maximal_marginal_relevance
+from .lexical import BM25Index, reciprocal_rank_fusion
+
+# where every topic lives with storage="shared"
+SHARED_DATABASE = "rag_database"
+SHARED_SCHEMA = "rag_schema"
+SHARED_WAREHOUSE = "rag_warehouse"
+TOPICS_TABLE = "topics"
+
+# (account, qualified table, dimensions) whose database, schema, warehouse
+# and table were already created by this process; the DDL is idempotent, so
+# this only saves round-trips
+_BOOTSTRAPPED_TABLES: set[tuple[str, str, int]] = set()
+# (account, qualified table, topic) already in the shared topic registry
+_REGISTERED_TOPICS: set[tuple[str, str, str]] = set()
+# (database, schema, warehouse) each connection currently uses
+_CONNECTION_CONTEXTS: "weakref.WeakKeyDictionary[SnowflakeConnection, tuple[str, str, str]]" = (
+    weakref.WeakKeyDictionary()
+)
+_BOOTSTRAP_LOCK = threading.Lock()
+# columns of a chunk table, whose IDs are numbered from {start}
+_CHUNK_COLUMNS = """
+    ID INTEGER AUTOINCREMENT START {start} INCREMENT 1,
+    UUID STRING DEFAULT UUID_STRING(),
+    TEXT VARCHAR,
+    METADATA VARIANT,
+    EMBEDDINGS VECTOR(FLOAT, %(dim)s),
+    CONTENT_HASH STRING,
+    CLUSTER_ID INTEGER,
+    TOPIC STRING
+"""
+
+
+def _metadata_expression(columns: dict[str, str], alias: str = "") -> str:
+    """
+    METADATA as a VARIANT, given the data types of the METADATA and
+    METADATA_VARIANT columns a chunk table has.
+    """
+    if columns.get("METADATA") == "VARIANT" and "METADATA_VARIANT" not in columns:
+        return f"{alias}METADATA"
+    # tables half-converted in place may hold the parsed metadata in
+    # METADATA_VARIANT, the raw text in METADATA, or both
+    sources = []
+    if "METADATA_VARIANT" in columns:
+        sources.append(f"{alias}METADATA_VARIANT")
+    if "METADATA" in columns:
+        sources.append(f"TRY_PARSE_JSON({alias}METADATA)")
+    return sources[0] if len(sources) == 1 else f"COALESCE({', '.join(sources)})"
 
 
 class SnowflakeCortexVectorStore(VectorStore):
@@ -15,13 +74,77 @@ class SnowflakeCortexVectorStore(VectorStore):
         topic: str,
         embedding: Embeddings,
         dimensions: int,
+        insert_batch_size: int = 32,
+        local_index: bool = False,
+        index_path: str | None = None,
+        ivf: bool = False,
+        ivf_nprobe: int = 8,
+        quantization: Literal["int8", "binary"] | None = None,
+        rescore_factor: int | None = None,
+        lexical_index: bool = False,
+        lexical_threshold: float | None = None,
+        storage: Literal["per_topic", "shared"] = "per_topic",
+        database: str | None = None,
+        schema: str | None = None,
+        warehouse: str | None = None,
+        version_ttl: float = 5.0,
     ) -> None:
+        if storage not in ("per_topic", "shared"):
+            raise ValueError(f"Unsupported storage: {storage}")
         self.connection = connection
         self.topic = topic
         self.embedding = embedding
         self.dimensions = dimensions
-        self.create_db_schema_wh_if_not_exists()
-        self.create_table_if_not_exists()
+        # "per_topic": a database, schema, warehouse and table of its own
+        # for every topic; "shared": one table per embedding dimension in a
+        # shared schema, with the topic as a column, so that a new topic is
+        # a row in the topic registry instead of a round of DDL
+        self.storage = storage
+        shared = storage == "shared"
+        self.database = database or (SHARED_DATABASE if shared else f"{topic}_database")
+        self.schema = schema or (SHARED_SCHEMA if shared else f"{topic}_schema")
+        self.warehouse = warehouse or (SHARED_WAREHOUSE if shared else f"{topic}_warehouse")
+        # rows per INSERT; each row inlines a full embedding into the
+        # statement text, so keep this well under the 1MB statement limit
+        self.insert_batch_size = insert_batch_size
+        # caches built on top of this store invalidate on ``version``, which
+        # is read from the table so that every store object and process on
+        # the topic agrees; re-read at most every ``version_ttl`` seconds and
+        # after every write made through this object
+        self.version_ttl = version_ttl
+        self._version: tuple[int, int] | None = None
+        self._version_read = 0.0
+        self.bootstrap()
+        # IVF: number of nearest clusters scanned per query; higher values
+        # trade latency for recall
+        self.ivf = ivf
+        self.ivf_nprobe = ivf_nprobe
+        self._centroids: np.ndarray | None = None
+        if ivf:
+            self.load_centroids()
+        # optional in-process mirror that answers similarity_search without
+        # a warehouse round-trip, optionally searching quantized codes first;
+        # see NumpyVectorIndex
+        self._index: NumpyVectorIndex | None = None
+        self.quantization = quantization if local_index else None
+        if local_index:
+            self._index = NumpyVectorIndex(
+                self.dimensions, index_path, quantization, rescore_factor
+            )
+            if self.refresh_index():
+                self.save_index()
+        # optional BM25 index over the chunk texts for hybrid search; with
+        # lexical_threshold, queries whose best keyword hit covers at least
+        # that share of the query's IDF weight skip embedding entirely
+        self.lexical_threshold = lexical_threshold
+        self._lexical: BM25Index | None = None
+        if lexical_index:
+            self._lexical = BM25Index()
+            self.refresh_lexical_index()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
 
     @classmethod
     def from_texts(
@@ -31,6 +154,7 @@ class SnowflakeCortexVectorStore(VectorStore):
         metadatas: Iterable[dict] | None = None,
         topic: str | None = None,
         connection: SnowflakeConnection | None = None,
+        ids: list[str] | None = None,
         **kwargs: Any,
     ) -> Self:
         if topic is None:
@@ -42,116 +166,1165 @@ class SnowflakeCortexVectorStore(VectorStore):
         vector_store = cls(
             topic=topic, embedding=embedding, connection=connection, **kwargs
         )
-        vector_store.add_texts(texts=texts, metadatas=metadatas)
+        vector_store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
         return vector_store
 
+    @property
+    def table(self) -> str:
+        if self.storage == "shared":
+            return f"chunks_{self.dimensions}"
+        return self.topic
+
+    @property
+    def centroid_table(self) -> str:
+        if self.storage == "shared":
+            return f"centroids_{self.dimensions}"
+        return f"{self.topic}_centroids"
+
+    def qualified(self, name: str) -> str:
+        return f"{self.database}.{self.schema}.{name}"
+
+    def bootstrap(self) -> None:
+        """
+        Run the DDL for this store's table once per process and only switch
+        the connection's database, schema and warehouse when they point
+        elsewhere. With shared storage, a topic the process has not seen
+        yet is added to the topic registry.
+        """
+        key = (self.connection.account, self.qualified(self.table), self.dimensions)
+        context = (self.database, self.schema, self.warehouse)
+        with _BOOTSTRAP_LOCK:
+            if key not in _BOOTSTRAPPED_TABLES:
+                self.create_db_schema_wh_if_not_exists()
+                self.create_table_if_not_exists()
+                _BOOTSTRAPPED_TABLES.add(key)
+            elif _CONNECTION_CONTEXTS.get(self.connection) != context:
+                self.use_db_schema_wh()
+            _CONNECTION_CONTEXTS[self.connection] = context
+            registration = (key[0], key[1], self.topic)
+            if self.storage == "shared" and registration not in _REGISTERED_TOPICS:
+                self.register_topic()
+                _REGISTERED_TOPICS.add(registration)
+
+    def use_db_schema_wh(self) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "USE DATABASE IDENTIFIER(%(database)s);",
+            params={"database": self.database}
+        )
+        cursor.execute(
+            "USE SCHEMA IDENTIFIER(%(schema)s);",
+            params={"schema": self.schema}
+        )
+        cursor.execute(
+            "USE WAREHOUSE IDENTIFIER(%(warehouse)s);",
+            params={"warehouse": self.warehouse}
+        )
+
     def create_db_schema_wh_if_not_exists(self) -> None:
         cursor = self.connection.cursor()
         cursor.execute(
             "CREATE DATABASE IF NOT EXISTS IDENTIFIER(%(database)s);",
-            params={"database": f"{self.topic}_database"}
+            params={"database": self.database}
         )
         cursor.execute(
             "USE DATABASE IDENTIFIER(%(database)s);",
-            params={"database": f"{self.topic}_database"}
+            params={"database": self.database}
         )
         cursor.execute(
             "CREATE SCHEMA IF NOT EXISTS IDENTIFIER(%(schema)s);",
-            params={"schema": f"{self.topic}_schema"}
+            params={"schema": self.schema}
         )
         cursor.execute(
             "USE SCHEMA IDENTIFIER(%(schema)s);",
-            params={"schema": f"{self.topic}_schema"}
+            params={"schema": self.schema}
         )
         cursor.execute(
             """
-            CREATE OR REPLACE WAREHOUSE IDENTIFIER(%(warehouse)s) WITH
+            CREATE WAREHOUSE IF NOT EXISTS IDENTIFIER(%(warehouse)s) WITH
                 WAREHOUSE_SIZE='X-SMALL'
                 AUTO_SUSPEND = 120
                 AUTO_RESUME = TRUE
                 INITIALLY_SUSPENDED=TRUE;
             """,
-            params={"warehouse": f"{self.topic}_warehouse"}
+            params={"warehouse": self.warehouse}
         )
         cursor.execute(
             "USE WAREHOUSE IDENTIFIER(%(warehouse)s);",
-            params={"warehouse": f"{self.topic}_warehouse"}
+            params={"warehouse": self.warehouse}
         )
 
     def create_table_if_not_exists(self) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME = UPPER(%(table)s);
+            """,
+            params={"table": self.table},
+        )
+        columns = dict(cursor.fetchall())
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS IDENTIFIER(%(table)s) ({_CHUNK_COLUMNS.format(start=1)});",
+            params={"table": self.table, "dim": self.dimensions},
+        )
+        if not columns and self.storage == "shared":
+            # micro-partitions hold a single topic, so topic-scoped scans
+            # prune everything else, and IVF probes prune within a topic
+            cursor.execute(
+                "ALTER TABLE IDENTIFIER(%(table)s) CLUSTER BY (TOPIC, CLUSTER_ID);",
+                params={"table": self.table},
+            )
+        # tables created before these columns existed
+        for column, dtype in (
+            ("CONTENT_HASH", "STRING"), ("CLUSTER_ID", "INTEGER"), ("TOPIC", "STRING")
+        ):
+            if columns and column not in columns:
+                cursor.execute(
+                    f"ALTER TABLE IDENTIFIER(%(table)s) ADD COLUMN IF NOT EXISTS {column} {dtype};",
+                    params={"table": self.table},
+                )
+        # METADATA_VARIANT is left over from the former in-place conversion
+        if columns and (
+            columns.get("METADATA") != "VARIANT" or "METADATA_VARIANT" in columns
+        ):
+            self.migrate_metadata_to_variant(columns)
         self.connection.cursor().execute(
             """
-            CREATE TABLE IF NOT EXISTS IDENTIFIER(%(topic)s)
+            CREATE TABLE IF NOT EXISTS IDENTIFIER(%(centroids)s)
             (
-                ID INTEGER AUTOINCREMENT,
-                UUID STRING DEFAULT UUID_STRING(),
-                TEXT VARCHAR,
-                METADATA VARCHAR,
-                EMBEDDINGS VECTOR(FLOAT, %(dim)s)
+                CLUSTER_ID INTEGER,
+                CENTROID VECTOR(FLOAT, %(dim)s),
+                TOPIC STRING
             );
             """,
-            params={"topic": self.topic, "dim": self.dimensions},
+            params={"centroids": self.centroid_table, "dim": self.dimensions},
         )
+        self.connection.cursor().execute(
+            "ALTER TABLE IDENTIFIER(%(centroids)s) ADD COLUMN IF NOT EXISTS TOPIC STRING;",
+            params={"centroids": self.centroid_table},
+        )
+        if self.storage == "shared":
+            self.connection.cursor().execute(
+                """
+                CREATE TABLE IF NOT EXISTS IDENTIFIER(%(topics)s)
+                (
+                    TOPIC STRING,
+                    DIMENSIONS INTEGER,
+                    CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP
+                );
+                """,
+                params={"topics": TOPICS_TABLE},
+            )
+
+    def register_topic(self) -> None:
+        """Add this topic to the registry of the shared schema, once."""
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            INSERT INTO IDENTIFIER(%(topics)s) (TOPIC, DIMENSIONS)
+            SELECT column1, column2
+            FROM (VALUES (%(topic)s, %(dim)s))
+            WHERE NOT EXISTS (
+                SELECT 1 FROM IDENTIFIER(%(topics)s)
+                WHERE TOPIC = %(topic)s AND DIMENSIONS = %(dim)s
+            );
+            """,
+            params={"topics": TOPICS_TABLE, "topic": self.topic, "dim": self.dimensions},
+        )
+        cursor.connection.commit()
+
+    def _topic_conditions(self, params: dict[str, Any], alias: str = "") -> list[str]:
+        """Restrict a statement to this topic's rows of a shared table."""
+        if self.storage != "shared":
+            return []
+        params["topic"] = self.topic
+        return [f"{alias}TOPIC = %(topic)s"]
+
+    @staticmethod
+    def _where(conditions: list[str]) -> str:
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    def migrate_metadata_to_variant(self, columns: dict[str, str]) -> None:
+        """
+        Convert the METADATA column of tables created when it was a VARCHAR
+        into a VARIANT, so that metadata filters can be evaluated in the
+        warehouse. ``columns`` maps METADATA and METADATA_VARIANT, where
+        present, to their data types.
+
+        The converted rows are copied into a staging table that is then
+        swapped with the original, so the original is untouched until the
+        swap and a failed conversion is simply redone by the next bootstrap.
+        """
+        metadata = _metadata_expression(columns)
+        params = {
+            "table": self.table,
+            "staging": f"{self.table}_variant_migration",
+            "dim": self.dimensions,
+        }
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT COALESCE(MAX(ID), 0) FROM IDENTIFIER(%(table)s);", params=params
+        )
+        (max_id,) = cursor.fetchone()
+        # new rows must not reuse the IDs of copied ones
+        columns_ddl = _CHUNK_COLUMNS.format(start=int(max_id) + 1)
+        cursor.execute(
+            f"CREATE OR REPLACE TABLE IDENTIFIER(%(staging)s) ({columns_ddl});",
+            params=params,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO IDENTIFIER(%(staging)s)
+                (ID, UUID, TEXT, METADATA, EMBEDDINGS, CONTENT_HASH, CLUSTER_ID, TOPIC)
+            SELECT ID, UUID, TEXT, {metadata}, EMBEDDINGS, CONTENT_HASH, CLUSTER_ID, TOPIC
+            FROM IDENTIFIER(%(table)s);
+            """,
+            params=params,
+        )
+        cursor.connection.commit()
+        cursor.execute(
+            "ALTER TABLE IDENTIFIER(%(table)s) SWAP WITH IDENTIFIER(%(staging)s);",
+            params=params,
+        )
+        cursor.execute("DROP TABLE IF EXISTS IDENTIFIER(%(staging)s);", params=params)
+        cursor.connection.commit()
+
+    def get_version(self) -> tuple[int, int]:
+        """
+        ``(MAX(ID), COUNT(*))`` over this topic's rows. IDs only grow, so
+        any insert or delete, whoever makes it, changes the pair.
+        """
+        now = time.monotonic()
+        if self._version is None or now - self._version_read >= self.version_ttl:
+            params = {"table": self.table}
+            where = self._where(self._topic_conditions(params))
+            cursor = self.connection.cursor()
+            with span("sql", op="version"):
+                cursor.execute(
+                    f"SELECT COALESCE(MAX(ID), 0), COUNT(*) FROM IDENTIFIER(%(table)s) {where};",
+                    params=params,
+                )
+                max_id, count = cursor.fetchone()
+            self._version, self._version_read = (max_id, count), now
+        return self._version
+
+    @property
+    def version(self) -> tuple[int, int]:
+        return self.get_version()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        # matches SHA2(TEXT, 256) computed in Snowflake
+        return hashlib.sha256(text.encode()).hexdigest()
 
     def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Iterable[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        embeddings = self.embedding.embed_documents(texts)
+        ids = self.add_embeddings(texts, embeddings, metadatas, ids)
+        self.save_index()
+        return ids
+
+    def add_embeddings(
         self,
         texts: list[str],
-        metadatas: Iterable[dict],
+        embeddings: Iterable[list[float]],
+        metadatas: Iterable[dict] | None = None,
+        ids: list[str] | None = None,
     ) -> list[str]:
+        """
+        Insert texts whose embeddings have already been computed. The local
+        index is updated but not saved, so that a batched ingest can call
+        ``save_index`` once at the end.
+        """
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        embeddings = [list(e) for e in embeddings]
+        if self._centroids is not None and embeddings:
+            cluster_ids = self._assign_clusters(embeddings).tolist()
+        else:
+            cluster_ids = [None] * len(texts)
+        rows = list(zip(ids, texts, metadatas, embeddings, cluster_ids))
         cursor = self.connection.cursor()
-        embeddings = self.embedding.embed_documents(texts)
-        for t, m, e in zip(texts, metadatas, embeddings):
-            # https://github.com/b-art-b/langchain-snowpoc/blob/main/langchain_snowpoc/vectorstores.py#L97-L109
+        with span("sql", op="insert") as attributes:
+            for i in range(0, len(rows), self.insert_batch_size):
+                self._insert_rows(cursor, rows[i:i + self.insert_batch_size])
+            cursor.connection.commit()
+            attributes["rows"] = len(rows)
+        self._version = None
+        if self._index is not None:
+            self.refresh_index()
+        if self._lexical is not None:
+            self.refresh_lexical_index()
+        return ids
+
+    def _insert_rows(self, cursor: SnowflakeCursor, rows: list[tuple]) -> None:
+        # one multi-row INSERT per batch with every value bound as a parameter
+        values = ", ".join(
+            f"(%(uuid_{i})s, %(text_{i})s, %(metadata_{i})s, %(embedding_{i})s, "
+            f"%(hash_{i})s, %(cluster_{i})s)"
+            for i in range(len(rows))
+        )
+        params = {"table": self.table, "topic": self.topic, "dim": self.dimensions}
+        for i, (u, t, m, e, c) in enumerate(rows):
+            params[f"uuid_{i}"] = u
+            params[f"text_{i}"] = t
+            params[f"metadata_{i}"] = json.dumps(m)
+            params[f"embedding_{i}"] = json.dumps(list(e))
+            params[f"hash_{i}"] = self.content_hash(t)
+            params[f"cluster_{i}"] = c
+        cursor.execute(
+            f"""
+            INSERT INTO IDENTIFIER(%(table)s)
+                (UUID, TEXT, METADATA, EMBEDDINGS, CONTENT_HASH, CLUSTER_ID, TOPIC)
+            SELECT
+                column1,
+                column2,
+                PARSE_JSON(column3),
+                PARSE_JSON(column4)::ARRAY::VECTOR(FLOAT, %(dim)s),
+                column5,
+                column6,
+                %(topic)s
+            FROM (VALUES {values});
+            """,
+            params=params,
+        )
+
+    def get_content_hashes(self, filter: dict | None = None) -> dict[str, list[str]]:
+        """Map each content hash in the table, or in the rows matching the
+        metadata ``filter``, to the UUIDs of its rows."""
+        params = {"table": self.table}
+        conditions = self._topic_conditions(params)
+        if filter:
+            predicate, filter_params = compile_filter(filter)
+            conditions.append(f"({predicate})")
+            params.update(filter_params)
+        where = self._where(conditions)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            SELECT UUID, COALESCE(CONTENT_HASH, SHA2(TEXT, 256))
+            FROM IDENTIFIER(%(table)s)
+            {where};
+            """,
+            params=params,
+        )
+        hashes: dict[str, list[str]] = {}
+        for u, h in cursor:
+            hashes.setdefault(h, []).append(u)
+        return hashes
+
+    def delete(
+        self, ids: list[str] | None = None, filter: dict | None = None, **kwargs: Any
+    ) -> bool | None:
+        """Delete rows by UUID; with ``filter`` only those that also match it."""
+        if not ids:
+            return False
+        cursor = self.connection.cursor()
+        with span("sql", op="delete") as attributes:
+            for i in range(0, len(ids), self.insert_batch_size):
+                batch = ids[i:i + self.insert_batch_size]
+                placeholders = ", ".join(f"%(uuid_{j})s" for j in range(len(batch)))
+                params = {f"uuid_{j}": u for j, u in enumerate(batch)}
+                params["table"] = self.table
+                conditions = [f"UUID IN ({placeholders})", *self._topic_conditions(params)]
+                if filter:
+                    predicate, filter_params = compile_filter(filter)
+                    conditions.append(f"({predicate})")
+                    params.update(filter_params)
+                cursor.execute(
+                    f"DELETE FROM IDENTIFIER(%(table)s) {self._where(conditions)};",
+                    params=params,
+                )
+            cursor.connection.commit()
+            attributes["rows"] = len(ids)
+        self._version = None
+        if self._index is not None:
+            self._index.remove(ids)
+            self._index.save()
+        if self._lexical is not None:
+            self._lexical.remove(ids)
+        return True
+
+    def _similarity_search(
+        self,
+        embedding: list[float],
+        k: int,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        documents, _ = self._search(embedding, k, nprobe, filter)
+        return documents
+
+    def _search(
+        self,
+        embedding: list[float],
+        k: int,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        with_embeddings: bool = False,
+    ) -> tuple[list[Document], list[list[float]]]:
+        """
+        Top-k query; with ``with_embeddings`` the stored embeddings of the
+        hits come back in the same round-trip.
+        """
+        params = {"dim": self.dimensions, "k": k, "table": self.table}
+        conditions = self._conditions([embedding], nprobe, filter, params)
+        where = self._where(conditions)
+        extra = ", EMBEDDINGS" if with_embeddings else ""
+        cursor = self.connection.cursor()
+        with span("sql", op="search") as attributes:
             cursor.execute(
                 f"""
-                MERGE INTO IDENTIFIER(%(topic)s) orig USING (
-                    SELECT
-                        UUID_STRING() AS UUID,
-                        TO_VARCHAR(%(text)s) AS TEXT,
-                        PARSE_JSON(%(metadata)s) AS METADATA,
-                        {e}::VECTOR(FLOAT, %(dim)s) AS EMBEDDINGS
-                    ) new
-                ON new.UUID = orig.UUID
-                WHEN NOT MATCHED THEN
-                    INSERT (UUID, TEXT, METADATA, EMBEDDINGS)
-                    VALUES (new.UUID, new.TEXT, new.METADATA, new.EMBEDDINGS);
+                SELECT
+                    TEXT,
+                    METADATA{extra},
+                    VECTOR_COSINE_SIMILARITY(EMBEDDINGS, {embedding}::VECTOR(FLOAT, %(dim)s)) AS SCORE
+                FROM IDENTIFIER(%(table)s)
+                {where}
+                ORDER BY SCORE DESC
+                LIMIT %(k)s;
                 """,
-                params={
-                    "topic": self.topic,
-                    "text": t.replace("'", "\\'"),
-                    "metadata": json.dumps(m),
-                    "dim": self.dimensions,
-                }
+                params=params,
             )
-        cursor.connection.commit()
+            rows = cursor.fetchall()
+            attributes["rows"] = len(rows)
+        documents, embeddings = [], []
+        for row in rows:
+            t, m, s = row[0], row[1], row[-1]
+            if with_embeddings:
+                e = row[2]
+                embeddings.append(json.loads(e) if isinstance(e, str) else e)
+            metadata = json.loads(m) if m else {}
+            metadata["score"] = s
+            doc = Document(t, metadata=metadata)
+            documents.append(doc)
+        return documents, embeddings
 
-    def _similarity_search(self, embedding: list[float], k: int) -> list[Document]:
+    def _conditions(
+        self,
+        embeddings: list[list[float]],
+        nprobe: int | None,
+        filter: dict | None,
+        params: dict[str, Any],
+        alias: str = "",
+    ) -> list[str]:
+        """WHERE clauses for the topic, a metadata filter and IVF cluster
+        pruning."""
+        conditions = self._topic_conditions(params, alias)
+        if filter:
+            # evaluated in the warehouse, before the top-k cut
+            predicate, filter_params = compile_filter(filter, f"{alias}METADATA")
+            conditions.append(f"({predicate})")
+            params.update(filter_params)
+        nprobe = self.ivf_nprobe if nprobe is None else nprobe
+        if self._centroids is not None and nprobe < len(self._centroids):
+            # only scan the nearest clusters of each query, plus rows not
+            # assigned yet
+            scores = NumpyVectorIndex.normalize(embeddings) @ self._centroids.T
+            probes = np.unique(np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe])
+            placeholders = ", ".join(f"%(probe_{i})s" for i in range(len(probes)))
+            params.update({f"probe_{i}": int(c) for i, c in enumerate(probes)})
+            conditions.append(
+                f"({alias}CLUSTER_ID IN ({placeholders}) OR {alias}CLUSTER_ID IS NULL)"
+            )
+        return conditions
+
+    def _assign_clusters(self, embeddings: list[list[float]]) -> np.ndarray:
+        return (NumpyVectorIndex.normalize(embeddings) @ self._centroids.T).argmax(axis=1)
+
+    def load_centroids(self) -> int:
+        """Load the IVF centroids of this topic; returns the cluster count."""
+        params = {"centroids": self.centroid_table}
+        where = self._where(self._topic_conditions(params))
         cursor = self.connection.cursor()
         cursor.execute(
             f"""
-            SELECT
-                TEXT,
-                METADATA,
-                VECTOR_COSINE_SIMILARITY(EMBEDDINGS, {embedding}::VECTOR(FLOAT, %(dim)s)) AS SCORE
-            FROM IDENTIFIER(%(topic)s)
-            ORDER BY SCORE DESC
-            LIMIT %(k)s;
+            SELECT CLUSTER_ID, CENTROID FROM IDENTIFIER(%(centroids)s)
+            {where}
+            ORDER BY CLUSTER_ID;
+            """,
+            params=params,
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            # an IVF store without centroids yet behaves like an exact one
+            self._centroids = None
+            return 0
+        self._centroids = NumpyVectorIndex.normalize(
+            [json.loads(c) if isinstance(c, str) else c for _, c in rows]
+        )
+        return len(rows)
+
+    def build_ivf(
+        self,
+        n_clusters: int | None = None,
+        sample_size: int = 20_000,
+        max_iter: int = 25,
+        rebalance: bool = False,
+        growth_factor: float = 2.0,
+        drift_tolerance: float = 0.01,
+    ) -> int:
+        """
+        Train IVF centroids with k-means on a random sample of the topic
+        table, store them and assign every row to its nearest centroid.
+
+        ``n_clusters`` defaults to the square root of the row count. With
+        ``rebalance`` the current centroids are used as the starting point
+        and their count is kept until that square root reaches
+        ``growth_factor`` times it, so that cluster IDs stay stable while
+        the data drifts. A rebalance only reassigns rows without a cluster
+        and rows of clusters whose centroid moved by more than
+        ``drift_tolerance`` cosine distance, and keeps the clustering key.
+        """
+        params = {"table": self.table, "sample_size": sample_size}
+        where = self._where(self._topic_conditions(params))
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            SELECT EMBEDDINGS FROM IDENTIFIER(%(table)s)
+            {where}
+            ORDER BY RANDOM()
+            LIMIT %(sample_size)s;
             """,
-            params={
-                "dim": self.dimensions,
-                "k": k,
-                "topic": self.topic,
+            params=params,
+        )
+        sample = [json.loads(e) if isinstance(e, str) else e for (e,) in cursor]
+        if not sample:
+            return 0
+        current = len(self._centroids) if rebalance and self._centroids is not None else 0
+        if n_clusters is None:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM IDENTIFIER(%(table)s) {where};", params=params
+            )
+            (count,) = cursor.fetchone()
+            n_clusters = max(1, round(count ** 0.5))
+            if current and n_clusters < growth_factor * current:
+                n_clusters = current
+        # kmeans only warm-starts from centroids of the same count
+        warm = current == min(n_clusters, len(sample))
+        init = self._centroids if warm else None
+        centroids, _ = kmeans(np.asarray(sample), n_clusters, max_iter, init)
+        params = {"centroids": self.centroid_table}
+        cursor.execute(
+            f"DELETE FROM IDENTIFIER(%(centroids)s) {self._where(self._topic_conditions(params))};",
+            params=params,
+        )
+        for start in range(0, len(centroids), self.insert_batch_size):
+            batch = centroids[start:start + self.insert_batch_size]
+            values = ", ".join(
+                f"(%(cluster_{i})s, %(centroid_{i})s)" for i in range(len(batch))
+            )
+            params = {
+                "centroids": self.centroid_table, "dim": self.dimensions, "topic": self.topic
             }
+            for i, c in enumerate(batch):
+                params[f"cluster_{i}"] = start + i
+                params[f"centroid_{i}"] = json.dumps(c.tolist())
+            cursor.execute(
+                f"""
+                INSERT INTO IDENTIFIER(%(centroids)s) (CLUSTER_ID, CENTROID, TOPIC)
+                SELECT column1, PARSE_JSON(column2)::ARRAY::VECTOR(FLOAT, %(dim)s), %(topic)s
+                FROM (VALUES {values});
+                """,
+                params=params,
+            )
+        # assign the rows inside the warehouse rather than shipping all
+        # embeddings to the client
+        params = {"table": self.table, "centroids": self.centroid_table}
+        conditions = self._topic_conditions(params, "r.") + self._topic_conditions(params, "c.")
+        if warm:
+            drift = 1 - np.einsum("ij,ij->i", centroids, self._centroids)
+            moved = np.flatnonzero(drift > drift_tolerance)
+            placeholders = ", ".join(f"%(moved_{i})s" for i in range(len(moved)))
+            params.update({f"moved_{i}": int(c) for i, c in enumerate(moved)})
+            conditions.append(
+                f"(r.CLUSTER_ID IN ({placeholders}) OR r.CLUSTER_ID IS NULL)"
+                if len(moved) else "r.CLUSTER_ID IS NULL"
+            )
+        cursor.execute(
+            f"""
+            UPDATE IDENTIFIER(%(table)s) AS tgt
+            SET CLUSTER_ID = nearest.CLUSTER_ID
+            FROM (
+                SELECT
+                    r.ID,
+                    c.CLUSTER_ID,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY r.ID
+                        ORDER BY VECTOR_COSINE_SIMILARITY(r.EMBEDDINGS, c.CENTROID) DESC
+                    ) AS RN
+                FROM IDENTIFIER(%(table)s) r
+                CROSS JOIN IDENTIFIER(%(centroids)s) c
+                {self._where(conditions)}
+            ) nearest
+            WHERE tgt.ID = nearest.ID AND nearest.RN = 1
+                AND (tgt.CLUSTER_ID IS NULL OR tgt.CLUSTER_ID <> nearest.CLUSTER_ID);
+            """,
+            params=params,
         )
+        if self.storage == "per_topic" and not warm:
+            # a shared table is already clustered by (TOPIC, CLUSTER_ID)
+            cursor.execute(
+                "ALTER TABLE IDENTIFIER(%(table)s) CLUSTER BY (CLUSTER_ID);",
+                params={"table": self.table},
+            )
+        cursor.connection.commit()
+        self._centroids = centroids
+        self._version = None
+        return len(centroids)
+
+    def refresh_index(self) -> int:
+        """Pull rows added since the last refresh into the local index;
+        see ``save_index`` to persist them."""
+        params = {"table": self.table, "last_id": self._index.last_id}
+        conditions = ["ID > %(last_id)s", *self._topic_conditions(params)]
+        cursor = self.connection.cursor()
+        with span("sql", op="refresh") as attributes:
+            cursor.execute(
+                f"""
+                SELECT ID, UUID, TEXT, METADATA, EMBEDDINGS
+                FROM IDENTIFIER(%(table)s)
+                {self._where(conditions)}
+                ORDER BY ID;
+                """,
+                params=params,
+            )
+            rows = cursor.fetchall()
+            attributes["rows"] = len(rows)
+        ids, uuids, texts, metadatas, embeddings = [], [], [], [], []
+        for i, u, t, m, e in rows:
+            ids.append(i)
+            uuids.append(u)
+            texts.append(t)
+            metadatas.append(json.loads(m) if m else {})
+            embeddings.append(json.loads(e) if isinstance(e, str) else e)
+        if ids:
+            self._index.add(ids, uuids, texts, metadatas, embeddings)
+        return len(ids)
+
+    def save_index(self) -> None:
+        """Persist the local index to its ``index_path``, if it has one."""
+        if self._index is not None:
+            self._index.save()
+
+    def refresh_lexical_index(self) -> int:
+        """Pull the texts of rows added since the last refresh into the
+        BM25 index; embeddings are not transferred."""
+        params = {"table": self.table, "last_id": self._lexical.last_id}
+        conditions = ["ID > %(last_id)s", *self._topic_conditions(params)]
+        cursor = self.connection.cursor()
+        with span("sql", op="refresh_lexical") as attributes:
+            cursor.execute(
+                f"""
+                SELECT ID, UUID, TEXT, METADATA
+                FROM IDENTIFIER(%(table)s)
+                {self._where(conditions)}
+                ORDER BY ID;
+                """,
+                params=params,
+            )
+            rows = cursor.fetchall()
+            attributes["rows"] = len(rows)
+        if rows:
+            ids, uuids, texts, metadatas = zip(*rows)
+            self._lexical.add(
+                list(ids), list(uuids), list(texts),
+                [json.loads(m) if m else {} for m in metadatas],
+            )
+        return len(rows)
+
+    def _keyword_search(
+        self, query: str, k: int, filter: dict | None = None
+    ) -> tuple[list[Document], float]:
+        if self._lexical is None:
+            raise ValueError("Keyword search requires lexical_index=True.")
+        metadatas = self._lexical.metadatas
+        accept = (lambda slot: match_filter(metadatas[slot], filter)) if filter else None
+        with span("lexical", op="search") as attributes:
+            hits, coverage = self._lexical.search(query, k, accept)
+            attributes["rows"] = len(hits)
+        documents = [
+            Document(self._lexical.texts[i], metadata={**metadatas[i], "score": s})
+            for i, s in hits
+        ]
+        return documents, coverage
+
+    def keyword_search(
+        self, query: str, k: int = 5, filter: dict | None = None
+    ) -> list[Document]:
+        """BM25 search over the chunk texts; ``score`` is the BM25 score."""
+        documents, _ = self._keyword_search(query, k, filter)
+        return documents
+
+    def lexical_fast_path(
+        self, query: str, k: int = 5, filter: dict | None = None
+    ) -> list[Document] | None:
+        """
+        Keyword results for ``query`` if the best hit is confident enough
+        to skip the vector search (see ``lexical_threshold``), else None.
+        """
+        if self._lexical is None or self.lexical_threshold is None:
+            return None
+        documents, coverage = self._keyword_search(query, k, filter)
+        if not documents or coverage < self.lexical_threshold:
+            return None
+        inc("lexical_fast_path_total")
+        return documents
+
+    def hybrid_search_by_vector(
+        self,
+        query: str,
+        embedding: list[float],
+        k: int = 5,
+        fetch_k: int = 20,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        """
+        Fuse the top ``fetch_k`` keyword and vector hits with reciprocal
+        rank fusion; ``score`` is the fused score.
+        """
+        lexical, _ = self._keyword_search(query, fetch_k, filter)
+        semantic = self.similarity_search_by_vector(embedding, fetch_k, nprobe, filter)
+        return reciprocal_rank_fusion([lexical, semantic], k)
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 5,
+        fetch_k: int = 20,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        documents = self.lexical_fast_path(query, k, filter)
+        if documents is not None:
+            return documents
+        embedding = self.embedding.embed_query(query)
+        return self.hybrid_search_by_vector(query, embedding, k, fetch_k, nprobe, filter)
+
+    def _local_mask(self, filter: dict | None) -> np.ndarray | None:
+        if not filter:
+            return None
+        return np.fromiter(
+            (match_filter(m, filter) for m in self._index.metadatas), dtype=bool
+        )
+
+    def quantization_recall(self, queries: list[str], k: int = 5) -> float:
+        """Recall@k of the local index's quantized search against exact search."""
+        if self._index is None:
+            raise ValueError("Quantization requires local_index=True.")
+        return self._index.recall(list(self.embedding.embed_documents(queries)), k)
+
+    def _local_similarity_search(
+        self, embedding: list[float], k: int, filter: dict | None = None
+    ) -> list[Document]:
+        with span("index", op="search"):
+            hits = self._index.search(embedding, k, self._local_mask(filter))
         documents = []
-        for t, m, s in cursor:
-            metadata = json.loads(m) or {}
+        for i, s in hits:
+            metadata = dict(self._index.metadatas[i])
             metadata["score"] = s
-            doc = Document(t, metadata=metadata)
+            doc = Document(self._index.texts[i], metadata=metadata)
             documents.append(doc)
         return documents
 
-    def similarity_search(self, query: str, k: int = 5) -> list[Document]:
+    def _max_marginal_relevance_search(
+        self,
+        embedding: list[float],
+        k: int,
+        fetch_k: int,
+        lambda_mult: float,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        if self._index is not None:
+            hits = self._index.search(embedding, fetch_k, self._local_mask(filter))
+            candidates = self._index.vectors([i for i, _ in hits])
+            documents = [
+                Document(
+                    self._index.texts[i],
+                    metadata={**self._index.metadatas[i], "score": s},
+                )
+                for i, s in hits
+            ]
+        else:
+            documents, candidates = self._search(
+                embedding, fetch_k, nprobe, filter, with_embeddings=True
+            )
+        selected = maximal_marginal_relevance(
+            embedding, np.asarray(candidates, dtype=np.float32), k, lambda_mult
+        )
+        return [documents[i] for i in selected]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return self._max_marginal_relevance_search(
+            embedding, k, fetch_k, lambda_mult, nprobe, filter
+        )
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
         embedding = self.embedding.embed_query(query)
-        docs_and_scores = self._similarity_search(embedding, k)
+        return self._max_marginal_relevance_search(
+            embedding, k, fetch_k, lambda_mult, nprobe, filter
+        )
+
+    def similarity_search_batch_by_vector(
+        self,
+        embeddings: list[list[float]],
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[list[Document]]:
+        """
+        Answer several queries with one statement: the query vectors are
+        cross-joined with the topic table and QUALIFY keeps the top ``k``
+        rows per query, so N queries cost a single scan.
+        """
+        embeddings = [list(e) for e in embeddings]
+        if not embeddings:
+            return []
+        if self._index is not None:
+            return [self._local_similarity_search(e, k, filter) for e in embeddings]
+        values = ", ".join(
+            f"(%(qid_{i})s, %(query_{i})s)" for i in range(len(embeddings))
+        )
+        params = {"dim": self.dimensions, "k": k, "table": self.table}
+        for i, e in enumerate(embeddings):
+            params[f"qid_{i}"] = i
+            params[f"query_{i}"] = json.dumps(e)
+        # with IVF the union of every query's nearest clusters is scanned
+        conditions = self._conditions(embeddings, nprobe, filter, params, alias="T.")
+        where = self._where(conditions)
+        cursor = self.connection.cursor()
+        with span("sql", op="search_batch") as attributes:
+            cursor.execute(
+                f"""
+                SELECT
+                    Q.QID AS QID,
+                    T.TEXT,
+                    T.METADATA,
+                    VECTOR_COSINE_SIMILARITY(T.EMBEDDINGS, Q.QV) AS SCORE
+                FROM IDENTIFIER(%(table)s) T
+                CROSS JOIN (
+                    SELECT
+                        column1 AS QID,
+                        PARSE_JSON(column2)::ARRAY::VECTOR(FLOAT, %(dim)s) AS QV
+                    FROM (VALUES {values})
+                ) Q
+                {where}
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY QID ORDER BY SCORE DESC) <= %(k)s
+                ORDER BY QID, SCORE DESC;
+                """,
+                params=params,
+            )
+            rows = cursor.fetchall()
+            attributes["rows"] = len(rows)
+            attributes["queries"] = len(embeddings)
+        results: list[list[Document]] = [[] for _ in embeddings]
+        for q, t, m, s in rows:
+            metadata = json.loads(m) if m else {}
+            metadata["score"] = s
+            results[q].append(Document(t, metadata=metadata))
+        return results
+
+    def similarity_search_batch(
+        self,
+        queries: list[str],
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[list[Document]]:
+        """Embed ``queries`` in one request and search them in one statement."""
+        # Cortex embeds queries and documents alike, so one batched
+        # embed_documents call covers every query
+        embeddings = self.embedding.embed_documents(list(queries))
+        return self.similarity_search_batch_by_vector(embeddings, k, nprobe, filter)
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        if self._index is not None:
+            return self._local_similarity_search(embedding, k, filter)
+        return self._similarity_search(embedding, k, nprobe, filter)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        embedding = self.embedding.embed_query(query)
+        docs_and_scores = self.similarity_search_by_vector(embedding, k, nprobe, filter)
         return docs_and_scores
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Iterable[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        embeddings = await self.embedding.aembed_documents(texts)
+        return await run_blocking(
+            self.connection, self.add_embeddings, texts, embeddings, metadatas, ids
+        )
+
+    async def adelete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        return await run_blocking(self.connection, self.delete, ids, **kwargs)
+
+    async def aget_version(self) -> tuple[int, int]:
+        return await run_blocking(self.connection, self.get_version)
+
+    async def asimilarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        if self._index is not None:
+            return self._local_similarity_search(embedding, k, filter)
+        return await run_blocking(
+            self.connection, self._similarity_search, embedding, k, nprobe, filter
+        )
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        embedding = await self.embedding.aembed_query(query)
+        return await self.asimilarity_search_by_vector(embedding, k, nprobe, filter)
+
+    async def amax_marginal_relevance_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return await run_blocking(
+            self.connection,
+            self._max_marginal_relevance_search,
+            embedding, k, fetch_k, lambda_mult, nprobe, filter,
+        )
+
+    async def amax_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        embedding = await self.embedding.aembed_query(query)
+        return await self.amax_marginal_relevance_search_by_vector(
+            embedding, k, fetch_k, lambda_mult, nprobe, filter
+        )
+
+    async def asimilarity_search_batch(
+        self,
+        queries: list[str],
+        k: int = 5,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[list[Document]]:
+        embeddings = await self.embedding.aembed_documents(list(queries))
+        return await run_blocking(
+            self.connection,
+            self.similarity_search_batch_by_vector,
+            embeddings, k, nprobe, filter,
+        )
+
+    async def ahybrid_search_by_vector(
+        self,
+        query: str,
+        embedding: list[float],
+        k: int = 5,
+        fetch_k: int = 20,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        lexical, _ = self._keyword_search(query, fetch_k, filter)
+        semantic = await self.asimilarity_search_by_vector(
+            embedding, fetch_k, nprobe, filter
+        )
+        return reciprocal_rank_fusion([lexical, semantic], k)
+
+    async def ahybrid_search(
+        self,
+        query: str,
+        k: int = 5,
+        fetch_k: int = 20,
+        nprobe: int | None = None,
+        filter: dict | None = None,
+    ) -> list[Document]:
+        documents = self.lexical_fast_path(query, k, filter)
+        if documents is not None:
+            return documents
+        embedding = await self.embedding.aembed_query(query)
+        return await self.ahybrid_search_by_vector(
+            query, embedding, k, fetch_k, nprobe, filter
+        )
+
+
+def migrate_to_shared(
+    connection: SnowflakeConnection,
+    topic: str,
+    embedding: Embeddings,
+    dimensions: int,
+    drop: bool = False,
+    database: str | None = None,
+    schema: str | None = None,
+    warehouse: str | None = None,
+) -> int:
+    """
+    Copy the per-topic table of ``topic`` (and its IVF centroids) into the
+    shared table of its embedding dimension and register the topic; returns
+    the number of rows copied. Rows are matched on UUID, so a migration
+    that was interrupted can simply be run again. With ``drop`` the
+    topic's own database and warehouse are dropped afterwards.
+
+    The per-topic objects are only read, never bootstrapped, so a topic
+    without a table raises ValueError instead of being created empty.
+    """
+    source_database = f"{topic}_database"
+    source_schema = f"{topic}_schema"
+    target = SnowflakeCortexVectorStore(
+        connection, topic, embedding, dimensions,
+        storage="shared", database=database, schema=schema, warehouse=warehouse,
+    )
+    params = {
+        "table": target.table,
+        "centroids": target.centroid_table,
+        "source": f"{source_database}.{source_schema}.{topic}",
+        "source_centroids": f"{source_database}.{source_schema}.{topic}_centroids",
+        "columns": f"{source_database}.INFORMATION_SCHEMA.COLUMNS",
+        "source_name": topic,
+        "centroids_name": f"{topic}_centroids",
+        "topic": topic,
+    }
+    cursor = connection.cursor()
+    # the per-topic database holds nothing but the topic's schema
+    cursor.execute(
+        """
+        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM IDENTIFIER(%(columns)s)
+        WHERE TABLE_NAME IN (UPPER(%(source_name)s), UPPER(%(centroids_name)s));
+        """,
+        params=params,
+    )
+    tables: dict[str, dict[str, str]] = {}
+    for table, column, dtype in cursor.fetchall():
+        tables.setdefault(table, {})[column] = dtype
+    columns = tables.get(topic.upper())
+    if not columns:
+        raise ValueError(f"Topic {topic} has no table {params['source']} to migrate.")
+    # tables the source store never bootstrapped may lack newer columns
+    content_hash = (
+        "COALESCE(s.CONTENT_HASH, SHA2(s.TEXT, 256))"
+        if "CONTENT_HASH" in columns else "SHA2(s.TEXT, 256)"
+    )
+    cluster_id = "s.CLUSTER_ID" if "CLUSTER_ID" in columns else "NULL"
+    cursor = connection.cursor()
+    with span("sql", op="migrate") as attributes:
+        cursor.execute(
+            f"""
+            INSERT INTO IDENTIFIER(%(table)s)
+                (UUID, TEXT, METADATA, EMBEDDINGS, CONTENT_HASH, CLUSTER_ID, TOPIC)
+            SELECT
+                s.UUID,
+                s.TEXT,
+                {_metadata_expression(columns, "s.")},
+                s.EMBEDDINGS,
+                {content_hash},
+                {cluster_id},
+                %(topic)s
+            FROM IDENTIFIER(%(source)s) s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM IDENTIFIER(%(table)s) t
+                WHERE t.TOPIC = %(topic)s AND t.UUID = s.UUID
+            )
+            ORDER BY s.ID;
+            """,
+            params=params,
+        )
+        copied = cursor.rowcount
+        # the copied CLUSTER_IDs refer to the source's centroids
+        centroids = 0
+        if "CLUSTER_ID" in columns and params["centroids_name"].upper() in tables:
+            cursor.execute(
+                "SELECT COUNT(*) FROM IDENTIFIER(%(source_centroids)s);", params=params
+            )
+            (centroids,) = cursor.fetchone()
+        if centroids:
+            cursor.execute(
+                "DELETE FROM IDENTIFIER(%(centroids)s) WHERE TOPIC = %(topic)s;",
+                params=params,
+            )
+            cursor.execute(
+                """
+                INSERT INTO IDENTIFIER(%(centroids)s) (CLUSTER_ID, CENTROID, TOPIC)
+                SELECT CLUSTER_ID, CENTROID, %(topic)s
+                FROM IDENTIFIER(%(source_centroids)s);
+                """,
+                params=params,
+            )
+        cursor.connection.commit()
+        attributes["rows"] = copied
+    if drop:
+        cursor.execute("DROP TABLE IF EXISTS IDENTIFIER(%(source)s);", params=params)
+        cursor.execute(
+            "DROP TABLE IF EXISTS IDENTIFIER(%(source_centroids)s);", params=params
+        )
+        cursor.execute(
+            "DROP DATABASE IF EXISTS IDENTIFIER(%(database)s);",
+            params={"database": source_database},
+        )
+        cursor.execute(
+            "DROP WAREHOUSE IF EXISTS IDENTIFIER(%(warehouse)s);",
+            params={"warehouse": f"{topic}_warehouse"},
+        )
+        with _BOOTSTRAP_LOCK:
+            _BOOTSTRAPPED_TABLES.discard((connection.account, params["source"], dimensions))
+    return copied
@@ -0,0 +1,34 @@
+import pytest
+
+from rag_helpers.embeddings import SnowflakeCortexEmbeddings
+from rag_helpers.local import LocalSession, fake_embedding
+
+TEXTS = [f"text number {i} about {'shops' if i % 2 else 'parking'}" for i in range(23)]
+TEXTS.append("a text with 'quotes' and a backslash \\")
+
+
+@pytest.fixture
+def session():
+    session = LocalSession()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+@pytest.mark.parametrize("batch_size", [1, 5, 64])
+def test_embed_documents_keeps_input_order(session, batch_size, max_concurrency):
+    embeddings = SnowflakeCortexEmbeddings(
+        session=session, batch_size=batch_size, max_concurrency=max_concurrency
+    )
+    result = embeddings.embed_documents(TEXTS)
+    assert len(result) == len(TEXTS)
+    for text, embedding in zip(TEXTS, result):
+        assert embedding == pytest.approx(fake_embedding(text, 768), abs=1e-6)
+
+
+@pytest.mark.parametrize("batch_size", [1, 64])
+def test_embed_query_binds_the_text(session, batch_size):
+    embeddings = SnowflakeCortexEmbeddings(session=session, batch_size=batch_size)
+    text = TEXTS[-1]
+    assert embeddings.embed_query(text) == pytest.approx(fake_embedding(text, 768), abs=1e-6)
+    assert text not in session.connection.history[-1]
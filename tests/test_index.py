@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from rag_helpers.index import NumpyVectorIndex
+
+
+def rows(start, n, dimensions=8):
+    vectors = np.random.default_rng(start).normal(size=(n, dimensions))
+    ids = list(range(start, start + n))
+    return ids, [f"uuid-{i}" for i in ids], [f"text {i}" for i in ids], [{"n": i} for i in ids], vectors
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"])
+def test_save_reload_add(tmp_path, quantization):
+    path = str(tmp_path / "index")
+    index = NumpyVectorIndex(8, path, quantization)
+    index.add(*rows(0, 10))
+    index.save()
+
+    reloaded = NumpyVectorIndex(8, path, quantization)
+    assert len(reloaded) == 10 and reloaded.last_id == 9
+    ids, uuids, texts, metadatas, vectors = rows(10, 5)
+    reloaded.add(ids, uuids, texts, metadatas, vectors)
+    assert len(reloaded) == 15 and reloaded.last_id == 14
+    (best, score), *_ = reloaded.search(vectors[2], 3)
+    assert reloaded.uuids[best] == "uuid-12"
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+    reloaded.save()
+    again = NumpyVectorIndex(8, path, quantization)
+    assert again.uuids == [f"uuid-{i}" for i in range(15)]
+    np.testing.assert_allclose(again.matrix, reloaded.matrix)
@@ -0,0 +1,197 @@
+"""
+Headless ingestion of a whole document set.
+
+Files are loaded and split in a process pool, and their chunks are fed
+to a single IngestPipeline, which batches embedding and insertion. A
+JSON manifest records every finished file with its SHA-256, so an
+interrupted run can be resumed: files already done are not parsed again.
+Chunks whose content hash is already in the topic table are not
+re-embedded either, which covers files that were interrupted halfway.
+"""
+# standard library
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Iterable, Iterator, TypedDict
+# third-party library
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+# local
+from .ingest import LOADERS, IngestData, get_loader
+from .pipeline import IngestPipeline
+
+
+class ParsedFile(TypedDict):
+    path: str
+    chunks: list[Document]
+    seconds: float
+    error: str | None
+
+
+class FileReport(TypedDict):
+    path: str
+    sha256: str
+    status: str
+    chunks: int
+    new_chunks: int
+    parse_seconds: float
+    ingest_seconds: float
+    error: str | None
+
+
+def find_files(patterns: Iterable[str]) -> list[str]:
+    """Expand directories (recursively) and glob patterns into the
+    supported files they contain, sorted and without duplicates."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in LOADERS:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_file(path: str, text_splitter: TextSplitter) -> ParsedFile:
+    """Load and split one file; runs in a worker process."""
+    start = time.perf_counter()
+    try:
+        chunks = text_splitter.split_documents(get_loader(path).load())
+        error = None
+    except Exception as e:
+        chunks, error = [], f"{type(e).__name__}: {e}"
+    return ParsedFile(
+        path=path, chunks=chunks, seconds=time.perf_counter() - start, error=error
+    )
+
+
+def parse_files(
+    paths: list[str], text_splitter: TextSplitter, workers: int | None = None
+) -> Iterator[ParsedFile]:
+    """
+    Parse ``paths`` in a process pool and yield them as they finish. At
+    most two files per worker are in flight, so parsed chunks do not pile
+    up while embedding is the bottleneck.
+    """
+    workers = workers or os.cpu_count() or 1
+    window = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(paths)
+        pending: set[Future] = set()
+        while True:
+            for path in remaining:
+                pending.add(pool.submit(split_file, path, text_splitter))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class IngestManifest:
+    """Per-file results of a topic's ingestion runs, saved as JSON."""
+
+    def __init__(self, path: str, topic: str) -> None:
+        self.path = path
+        self.topic = topic
+        self.files: dict[str, FileReport] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("topic") != topic:
+                raise ValueError(
+                    f"Manifest {path} belongs to topic {data.get('topic')!r}."
+                )
+            self.files = data["files"]
+
+    def is_done(self, path: str, sha256: str) -> bool:
+        report = self.files.get(path)
+        return report is not None and report["status"] == "done" and report["sha256"] == sha256
+
+    def record(self, report: FileReport) -> None:
+        self.files[report["path"]] = report
+        self.save()
+
+    def save(self) -> None:
+        # write-then-rename, so an interrupted run never leaves a torn file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+            json.dump({"topic": self.topic, "files": self.files}, f, indent=2)
+        os.replace(f.name, self.path)
+
+
+def ingest_files(
+    ingester: IngestData,
+    paths: list[str],
+    manifest: IngestManifest,
+    workers: int | None = None,
+    batch_size: int = 256,
+) -> Iterator[FileReport]:
+    """
+    Ingest ``paths`` into the ingester's topic and yield a FileReport per
+    file once all of its chunks are stored (or it failed to parse).
+    """
+    hashes = {path: file_hash(path) for path in paths}
+    todo = [path for path in paths if not manifest.is_done(path, hashes[path])]
+    vector_store = ingester.get_vector_store()
+    existing = set(vector_store.get_content_hashes())
+    # files whose chunks are queued, with the insert count that completes them
+    queued: deque[tuple[FileReport, int, float]] = deque()
+    total = 0
+
+    def chunks() -> Iterator[Document]:
+        nonlocal total
+        for parsed in parse_files(todo, ingester.get_text_splitter(), workers):
+            new = []
+            for chunk in parsed["chunks"]:
+                h = vector_store.content_hash(chunk.page_content)
+                if h not in existing:
+                    existing.add(h)
+                    new.append(chunk)
+            report = FileReport(
+                path=parsed["path"],
+                sha256=hashes[parsed["path"]],
+                status="failed" if parsed["error"] else "done",
+                chunks=len(parsed["chunks"]),
+                new_chunks=len(new),
+                parse_seconds=parsed["seconds"],
+                ingest_seconds=0.0,
+                error=parsed["error"],
+            )
+            total += len(new)
+            queued.append((report, total, time.perf_counter()))
+            yield from new
+
+    def complete(inserted: int) -> Iterator[FileReport]:
+        while queued and queued[0][1] <= inserted:
+            report, _, start = queued.popleft()
+            report["ingest_seconds"] = time.perf_counter() - start
+            manifest.record(report)
+            yield report
+
+    pipeline = IngestPipeline(
+        documents=chunks(),
+        text_splitter=None,
+        vector_store=vector_store,
+        batch_size=batch_size,
+    )
+    for event in pipeline.run():
+        if event["stage"] in ("insert", "done"):
+            inserted = pipeline.stats["added"] if event["stage"] == "insert" else total
+            yield from complete(inserted)
+    yield from complete(total)
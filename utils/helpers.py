@@ -1,19 +1,28 @@
 # standard library
 import os
-import time
 from tempfile import NamedTemporaryFile
-from typing import Iterator
+import threading
+from typing import TYPE_CHECKING, Generator, Iterator
 import uuid
 # third-party library
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
-from langgraph.graph.state import CompiledStateGraph
-from snowflake.snowpark import Session
 import streamlit as st
+from streamlit.elements.lib.mutable_status_container import StatusContainer
 # local
-from .ingest import IngestData
-from agent.graph import Agent
+from rag_helpers import metrics
 # from agent.test import TestAgent as Agent
 
+# LangChain, LangGraph, Snowpark and the Mistral client take seconds to
+# import, so they are imported where they are first needed; the sidebar is
+# up before any of them is loaded
+if TYPE_CHECKING:
+    from langchain_core.messages import AIMessage, BaseMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.graph.state import CompiledStateGraph
+    from snowflake.snowpark import Session
+    from rag_helpers.cache import AnswerCache, EmbeddingCache, RetrievalCache
+    from rag_helpers.pool import SessionPool
+    from rag_helpers.vectorstore import SnowflakeCortexVectorStore
+
 
 CHAT_MODEL = st.secrets.get("CHAT_MODEL", "mistral-large-latest")  # "mistral-large2"
 CHAT_MODEL_TEMPERATURE = float(st.secrets.get("TEMPERATURE", 0.1))
@@ -23,44 +32,302 @@ SNOWFLAKE_USER = st.secrets.get("SNOWFLAKE_USER")
 SNOWFLAKE_PASSWORD = st.secrets.get("SNOWFLAKE_PASSWORD")
 VERBOSE = st.secrets.get("VERBOSE", "False") == "True"
 K = int(st.secrets.get("K", 5))
+LOCAL_INDEX = st.secrets.get("LOCAL_INDEX", "False") == "True"
+INDEX_DIR = st.secrets.get("INDEX_DIR")
+IVF = st.secrets.get("IVF", "False") == "True"
+IVF_NPROBE = int(st.secrets.get("IVF_NPROBE", 8))
+# compact codes searched first by the local index: "int8" or "binary"
+QUANTIZATION = st.secrets.get("QUANTIZATION")
+# candidates per result rescored exactly; by default 4 for int8 and 32 for
+# binary, whose recall is much lower at the same shortlist length
+RESCORE_FACTOR = st.secrets.get("RESCORE_FACTOR")
+# with SEARCH_TYPE = "hybrid", keyword hits covering at least this share of
+# the query's IDF weight skip the vector search
+LEXICAL_THRESHOLD = st.secrets.get("LEXICAL_THRESHOLD")
+EMBEDDING_CACHE_PATH = st.secrets.get("EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_MAX_MB = int(st.secrets.get("EMBEDDING_CACHE_MAX_MB", 512))
+# re-uploading a file replaces its earlier rows; rows ingested before
+# chunks were tagged with their file name are never matched
+INCREMENTAL_INGEST = st.secrets.get("INCREMENTAL_INGEST", "False") == "True"
+RETRIEVAL_CACHE = st.secrets.get("RETRIEVAL_CACHE", "False") == "True"
+RETRIEVAL_CACHE_THRESHOLD = float(st.secrets.get("RETRIEVAL_CACHE_THRESHOLD", 0.95))
+RETRIEVAL_CACHE_TTL = float(st.secrets.get("RETRIEVAL_CACHE_TTL", 3600))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(st.secrets.get("RETRIEVAL_CACHE_MAX_ENTRIES", 1024))
+# final answers of repeated questions, served without running the agent
+ANSWER_CACHE = st.secrets.get("ANSWER_CACHE", "False") == "True"
+ANSWER_CACHE_TTL = float(st.secrets.get("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(st.secrets.get("ANSWER_CACHE_MAX_ENTRIES", 1024))
+# also match differently worded questions this similar; costs an embed call
+ANSWER_CACHE_THRESHOLD = st.secrets.get("ANSWER_CACHE_THRESHOLD")
+SESSION_POOL_SIZE = int(st.secrets.get("SESSION_POOL_SIZE", 4))
+# "per_topic" (a database, schema, warehouse and table per topic) or
+# "shared" (one table per embedding dimension, see migrate.py)
+STORAGE = st.secrets.get("STORAGE", "per_topic")
+# "similarity", "mmr" or "hybrid" (BM25 keyword + vector search)
+SEARCH_TYPE = st.secrets.get("SEARCH_TYPE", "similarity")
+FETCH_K = int(st.secrets.get("FETCH_K", 20))
+HISTORY_MAX_TOKENS = int(st.secrets.get("HISTORY_MAX_TOKENS", 2000))
+SPECULATIVE_RETRIEVAL = st.secrets.get("SPECULATIVE_RETRIEVAL", "False") == "True"
+SPECULATIVE_THRESHOLD = float(st.secrets.get("SPECULATIVE_THRESHOLD", 0.9))
+MAX_PARALLEL_TOOLS = int(st.secrets.get("MAX_PARALLEL_TOOLS", 4))
+MAX_ITERATIONS = int(st.secrets.get("MAX_ITERATIONS", 5))
+METRICS_PANEL = st.secrets.get("METRICS_PANEL", "False") == "True"
+# Prometheus text file refreshed after every turn, e.g. for node_exporter
+METRICS_PATH = st.secrets.get("METRICS_PATH")
+
+
+############ config helper functions ############
+
+def vector_store_kwargs(topic: str) -> dict:
+    kwargs = {
+        "local_index": LOCAL_INDEX,
+        "ivf": IVF,
+        "ivf_nprobe": IVF_NPROBE,
+        "quantization": QUANTIZATION,
+        "rescore_factor": int(RESCORE_FACTOR) if RESCORE_FACTOR else None,
+        "lexical_index": SEARCH_TYPE == "hybrid",
+        "lexical_threshold": float(LEXICAL_THRESHOLD) if LEXICAL_THRESHOLD else None,
+        "storage": STORAGE,
+    }
+    if LOCAL_INDEX and INDEX_DIR:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        # row IDs of a shared table differ from those of the per-topic one,
+        # so its mirror must not pick up the other's saved index
+        name = topic if STORAGE == "per_topic" else f"{topic}.{STORAGE}"
+        kwargs["index_path"] = os.path.join(INDEX_DIR, name)
+    return kwargs
+
+
+@st.cache_resource
+def get_embedding_cache() -> "EmbeddingCache":
+    from rag_helpers.cache import EmbeddingCache
+    # shared by every browser session served by this process
+    return EmbeddingCache(
+        path=EMBEDDING_CACHE_PATH,
+        max_disk_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+    )
+
+
+@st.cache_resource
+def get_retrieval_cache(topic: str) -> "RetrievalCache":
+    from rag_helpers.cache import RetrievalCache
+    # one cache per topic, shared by every browser session
+    return RetrievalCache(
+        threshold=RETRIEVAL_CACHE_THRESHOLD,
+        ttl=RETRIEVAL_CACHE_TTL,
+        max_entries=RETRIEVAL_CACHE_MAX_ENTRIES,
+    )
+
+
+@st.cache_resource
+def get_answer_cache(topic: str) -> "AnswerCache":
+    from rag_helpers.cache import AnswerCache
+    # one cache per topic, shared by every browser session
+    return AnswerCache(
+        ttl=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        threshold=float(ANSWER_CACHE_THRESHOLD) if ANSWER_CACHE_THRESHOLD else None,
+    )
+
+
+def create_session() -> "Session":
+    from snowflake.snowpark import Session
+    connection_parameters = {
+        "account": SNOWFLAKE_ACCOUNT,
+        "user": SNOWFLAKE_USER,
+        "password": SNOWFLAKE_PASSWORD,
+        "paramstyle": "pyformat"
+    }
+    return Session.builder.configs(connection_parameters).create()
+
+
+@st.cache_resource
+def get_session_pool(context: str) -> "SessionPool":
+    from rag_helpers.pool import SessionPool
+    # one pool per database/schema/warehouse, so that a pooled connection
+    # never has to switch back and forth between them
+    return SessionPool(factory=create_session, max_size=SESSION_POOL_SIZE)
+
+
+def topic_session_pool(topic: str) -> "SessionPool":
+    # with shared storage every topic lives in the same schema
+    return get_session_pool(topic if STORAGE == "per_topic" else STORAGE)
+
+
+@st.cache_resource
+def get_checkpointer() -> "InMemorySaver":
+    from langgraph.checkpoint.memory import InMemorySaver
+    # conversations of every browser session, one thread each
+    return InMemorySaver()
+
+
+_TOPIC_RESOURCES_LOCK = threading.Lock()
+
+
+@st.cache_resource
+def get_topic_resources() -> dict[str, dict]:
+    # per topic, the arguments get_agent was called with and the sessions
+    # get_shared_vector_store leased, so that an upload can invalidate that
+    # topic alone
+    return {}
+
+
+def _topic_resources(topic: str) -> dict:
+    return get_topic_resources().setdefault(topic, {"agents": set(), "sessions": {}})
+
+
+@st.cache_resource
+def get_shared_vector_store(topic: str, embedding_model: str) -> "SnowflakeCortexVectorStore":
+    from .ingest import IngestData
+    # searched by the agents of every browser session on this topic; the
+    # lease on the pooled session is released by invalidate_topic
+    pool = topic_session_pool(topic)
+    session = pool.acquire()
+    with _TOPIC_RESOURCES_LOCK:
+        _topic_resources(topic)["sessions"][embedding_model] = (pool, session)
+    ingester = IngestData(
+        session=session,
+        topic=topic,
+        model=embedding_model,
+        vector_store_kwargs=vector_store_kwargs(topic),
+        embedding_cache=get_embedding_cache(),
+    )
+    return ingester.get_vector_store()
+
+
+@st.cache_resource
+def get_agent(
+    model: str,
+    temperature: float,
+    title: str,
+    topic: str,
+    embedding_model: str,
+    k: int,
+) -> "CompiledStateGraph":
+    from agent.graph import Agent
+    # graph, prompts and tool bindings are built once and shared; each
+    # browser session only brings its own checkpointer thread
+    with _TOPIC_RESOURCES_LOCK:
+        _topic_resources(topic)["agents"].add(
+            (model, temperature, title, topic, embedding_model, k)
+        )
+    vector_store = get_shared_vector_store(topic, embedding_model)
+    agent = Agent(
+        model=model,
+        temperature=temperature,
+        topic=title,
+        vector_store=vector_store,
+        k=k,
+        verbose=VERBOSE,
+        retrieval_cache=get_retrieval_cache(topic) if RETRIEVAL_CACHE else None,
+        search_type=SEARCH_TYPE,
+        fetch_k=FETCH_K,
+        history_max_tokens=HISTORY_MAX_TOKENS,
+        speculative_retrieval=SPECULATIVE_RETRIEVAL,
+        speculative_threshold=SPECULATIVE_THRESHOLD,
+        max_parallel_tools=MAX_PARALLEL_TOOLS,
+        max_iterations=MAX_ITERATIONS,
+    )
+    return agent.compile(checkpointer=get_checkpointer())
+
+
+def invalidate_topic(topic: str) -> None:
+    """
+    Drop the shared agents, vector stores, retrieval and answer caches of
+    ``topic``, so that they are rebuilt on its new rows; other topics and
+    the conversations in the checkpointer are kept.
+    """
+    with _TOPIC_RESOURCES_LOCK:
+        resources = get_topic_resources().pop(topic, {"agents": set(), "sessions": {}})
+    for args in resources["agents"]:
+        get_agent.clear(*args)
+    for embedding_model, (pool, session) in resources["sessions"].items():
+        get_shared_vector_store.clear(topic, embedding_model)
+        # turns still running on the old store keep the session usable
+        pool.release(session)
+    get_retrieval_cache(topic).clear()
+    get_answer_cache(topic).clear()
+
+
+def chat_vector_store() -> "SnowflakeCortexVectorStore":
+    """The shared vector store the agent of this browser session searches."""
+    return get_shared_vector_store(
+        st.session_state["store_topic"], st.session_state["embedding_model"]
+    )
 
 
 ############ callback functions ############
 
 def clear() -> None:
+    if "thread_id" in st.session_state:
+        get_checkpointer().delete_thread(st.session_state["thread_id"])
     st.session_state["chat_history"] = []
+    # a new checkpointer thread starts the agent's memory from scratch
+    st.session_state["thread_id"] = str(uuid.uuid4())
 
 
 def handle_ingestion() -> None:
+    from .ingest import LOADERS, IngestData
+    # a browser session only keeps the names of the store its agent uses;
+    # the store itself is shared, see get_shared_vector_store
     if st.session_state["source"] == "Use default":
         st.session_state["topic"] = "Whoville Shopping Mall"
-        ingester = IngestData(
-            session=st.session_state["session"],
-            topic="whovilleshoppingmall",
-        )
-        st.session_state["vector_store"] = ingester.get_vector_store()
+        st.session_state["store_topic"] = "whovilleshoppingmall"
+        st.session_state["embedding_model"] = "e5-base-v2"
     else:
         st.text_input(
             r"Topic / Title: $\\\textsf{\scriptsize Enter a concise and "
             r"descriptive title for the context about to be uploaded.}$",
             key="topic"
         )
-        uploaded_file = st.file_uploader("Upload a file", type="docx")
+        uploaded_file = st.file_uploader(
+            "Upload a file", type=[e.lstrip(".") for e in LOADERS]
+        )
         add_data = st.button("Add Data")
         if add_data:
             if uploaded_file:
-                ingester = IngestData(
-                    session=st.session_state["session"],
-                    topic="".join(st.session_state["topic"].split()).lower().replace("-", "_"),
-                    model=EMBEDDING_MODEL
-                )
-                with st.spinner("Reading, splitting and embedding a file..."):
-                    with NamedTemporaryFile(delete=False) as tmp:
-                        tmp.write(uploaded_file.read())
-                        vector_store = ingester.build_embeddings(tmp.name)
+                topic = "".join(st.session_state["topic"].split()).lower().replace("-", "_")
+                # the session is leased for the upload only
+                pool = topic_session_pool(topic)
+                session = pool.acquire()
+                # the extension selects the loader
+                suffix = os.path.splitext(uploaded_file.name)[1]
+                with NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                    tmp.write(uploaded_file.read())
+                progress_bar = st.progress(0.0, text="Reading, splitting and embedding a file...")
+                try:
+                    ingester = IngestData(
+                        session=session,
+                        topic=topic,
+                        model=EMBEDDING_MODEL,
+                        vector_store_kwargs=vector_store_kwargs(topic),
+                        embedding_cache=get_embedding_cache(),
+                    )
+                    pipeline = ingester.get_pipeline(
+                        tmp.name, incremental=INCREMENTAL_INGEST, source=uploaded_file.name
+                    )
+                    for event in pipeline.run():
+                        progress_bar.progress(
+                            event["fraction"],
+                            text="{}: {} chunks ({:.1f}/s)".format(
+                                event["stage"], event["count"], event["rate"]
+                            ),
+                        )
+                finally:
                     os.remove(tmp.name)
-                    st.success("File chunked, embedded and indexed successfully.")
-                    st.session_state["vector_store"] = vector_store
+                    pool.release(session)
+                progress_bar.empty()
+                st.success("File chunked, embedded and indexed successfully.")
+                if INCREMENTAL_INGEST:
+                    st.caption(
+                        "{added} chunks added, {kept} unchanged, "
+                        "{removed} removed.".format(**pipeline.stats)
+                    )
+                st.session_state["store_topic"] = topic
+                st.session_state["embedding_model"] = EMBEDDING_MODEL
+                # every session of this topic moves on to a store that has
+                # the new rows in its local and lexical indexes
+                invalidate_topic(topic)
             else:
                 msg = "Must either upload a file."
                 st.write(msg)
@@ -70,31 +337,129 @@ def handle_ingestion() -> None:
 ############ layout helper functions ############
 
 
-def create_answer(query: str) -> Iterator[str]:
-    agent: CompiledStateGraph = st.session_state["agent"]
-    chat_history: list[BaseMessage] = st.session_state["chat_history"]
-    response = agent.invoke(
-        st.session_state.to_dict(),
-        {"configurable": {"thread_id": str(uuid.uuid4)}},
-    )
-    ai_response: AIMessage = response["messages"][-1]
-    chat_history.extend((HumanMessage(content=query), ai_response))
-    for w in ai_response.content.split():
-        time.sleep(0.05)
-        yield f"{w} "
+def stream_agent(
+    query: str,
+    config: dict,
+    status: StatusContainer | None,
+    sources: dict[str, None],
+) -> Generator[str, None, tuple["AIMessage", bool]]:
+    """
+    Run one agent turn, yielding answer tokens as they are generated and
+    adding the content hashes of retrieved chunks to ``sources``; returns
+    the final message and whether any tokens were streamed.
+    """
+    from langchain_core.messages import AIMessageChunk, ToolMessage
+    from agent.tools import RETRIEVER_TOOL_NAME
+    agent: "CompiledStateGraph" = st.session_state["agent"]
+    content_hash = chat_vector_store().content_hash
+    final_response: "AIMessage | None" = None
+    streamed = False
+    # earlier turns come from the checkpointer, so only the new
+    # question is passed in
+    for mode, payload in agent.stream(
+        {"input": query},
+        config,
+        stream_mode=["messages", "updates"],
+    ):
+        if mode == "messages":
+            # LLM tokens as they are generated by the agent node
+            chunk, metadata = payload
+            if (
+                metadata.get("langgraph_node") == "agent"
+                and isinstance(chunk, AIMessageChunk)
+                and isinstance(chunk.content, str)
+                and chunk.content
+            ):
+                streamed = True
+                yield chunk.content
+        else:
+            for node, update in payload.items():
+                if node not in ("agent", "tools"):
+                    continue
+                message = update["messages"][-1]
+                if node == "agent" and message.tool_calls:
+                    if status is not None:
+                        for tool_call in message.tool_calls:
+                            status.update(label=f"Calling {tool_call['name']}...")
+                            status.write(f"{tool_call['name']}: {tool_call['args']}")
+                elif node == "agent":
+                    final_response = message
+                elif node == "tools":
+                    for m in update["messages"]:
+                        if isinstance(m, ToolMessage) and m.name == RETRIEVER_TOOL_NAME:
+                            sources.update(dict.fromkeys(
+                                content_hash(d.page_content)
+                                for d in m.artifact or []
+                            ))
+                    if status is not None:
+                        status.update(label="Writing the answer...")
+    return final_response, streamed
 
 
-def init_agent() -> None:
-    if "agent" not in st.session_state:
-        agent = Agent(
-            model=CHAT_MODEL,
-            temperature=CHAT_MODEL_TEMPERATURE,
-            topic=st.session_state["topic"],
-            vector_store=st.session_state["vector_store"],
-            k=K,
-            verbose=VERBOSE
+def lookup_answer(query: str) -> tuple["AIMessage | None", list[float] | None]:
+    """Cached answer for ``query``, if any, and the query embedding when
+    the answer cache matches by similarity."""
+    from langchain_core.messages import AIMessage
+    vector_store = chat_vector_store()
+    answer_cache = get_answer_cache(vector_store.topic)
+    embedding = None
+    if answer_cache.threshold is not None:
+        embedding = vector_store.embeddings.embed_query(query)
+    cached = answer_cache.get(query, vector_store.version, embedding)
+    metrics.inc("answer_cache_total", outcome="hit" if cached else "miss")
+    return (AIMessage(content=cached["answer"]) if cached else None), embedding
+
+
+def create_answer(query: str, status: StatusContainer | None = None) -> Iterator[str]:
+    from langchain_core.messages import HumanMessage
+    agent: "CompiledStateGraph" = st.session_state["agent"]
+    chat_history: list["BaseMessage"] = st.session_state["chat_history"]
+    config = {"configurable": {"thread_id": st.session_state["thread_id"]}}
+    final_response: "AIMessage | None" = None
+    embedding: list[float] | None = None
+    sources: dict[str, None] = {}
+    streamed = False
+    # the agent answers follow-ups from the conversation so far, so only the
+    # first question of a conversation is looked up or stored
+    use_cache = ANSWER_CACHE and not chat_history
+    with metrics.span("turn"), metrics.turn() as records:
+        if use_cache:
+            final_response, embedding = lookup_answer(query)
+        if final_response is not None:
+            # record the turn in the checkpointed conversation as if the
+            # agent had answered it
+            agent.update_state(
+                config,
+                {"chat_history": [HumanMessage(content=query), final_response]},
+                as_node="finish",
+            )
+        else:
+            final_response, streamed = yield from stream_agent(query, config, status, sources)
+    if use_cache and sources:
+        # only answers grounded in retrieved chunks are reused
+        vector_store = chat_vector_store()
+        get_answer_cache(vector_store.topic).put(
+            query, final_response.content, list(sources), vector_store.version, embedding
         )
-        st.session_state["agent"] = agent.compile()
+    st.session_state["turn_metrics"] = metrics.breakdown(records)
+    if METRICS_PATH:
+        metrics.write_prometheus(METRICS_PATH)
+    chat_history.extend((HumanMessage(content=query), final_response))
+    if not streamed:
+        yield final_response.content
+
+
+def init_agent() -> None:
+    # a cache lookup on every rerun, so that sessions move on to rebuilt
+    # agents after an upload
+    st.session_state["agent"] = get_agent(
+        CHAT_MODEL,
+        CHAT_MODEL_TEMPERATURE,
+        st.session_state["topic"],
+        st.session_state["store_topic"],
+        st.session_state["embedding_model"],
+        K,
+    )
 
 
 def display_chat_history() -> None:
@@ -109,8 +474,15 @@ def display_chat_history() -> None:
             st.markdown(prompt)
             st.session_state["input"] = prompt
         with st.chat_message("ai", avatar=icons["ai"]):
-            with st.spinner("Thinking..."):
-                st.write_stream(create_answer(prompt))
+            status = st.status("Thinking...")
+            st.write_stream(create_answer(prompt, status))
+            status.update(label="Done", state="complete", expanded=False)
+
+
+def display_turn_metrics() -> None:
+    if METRICS_PANEL and st.session_state.get("turn_metrics"):
+        with st.sidebar.expander("Last turn breakdown"):
+            st.dataframe(st.session_state["turn_metrics"], hide_index=True)
 
 
 ############ streamlit page layout functions ############
@@ -127,22 +499,8 @@ def init_sidebar():
     )
     start_session = st.button("Start Session")
     if start_session:
-        # close old session
-        if "session" in st.session_state:
-            st.session_state["session"].close()
-        if "agent" in st.session_state:
-            del st.session_state["agent"]
-        if "vector_store" in st.session_state:
-            del st.session_state["vector_store"]
-        # start new session
-        connection_parameters = {
-            "account": SNOWFLAKE_ACCOUNT,
-            "user": SNOWFLAKE_USER,
-            "password": SNOWFLAKE_PASSWORD,
-            "paramstyle": "pyformat"
-        }
-        session = Session.builder.configs(connection_parameters).create()
-        st.session_state["session"] = session
+        for key in ("agent", "store_topic", "embedding_model"):
+            st.session_state.pop(key, None)
         clear()
 
         st.radio(
@@ -162,6 +520,7 @@ def init_main_page() -> None:
         _, col = st.columns([3,1])
         with col:
             st.button("Reset chat history", key="reset_button", on_click=clear)
-        if "vector_store" in st.session_state:
+        if "store_topic" in st.session_state:
             init_agent()
         display_chat_history()
+        display_turn_metrics()
@@ -1,12 +1,23 @@
+# standard library
+import os
+from typing import Callable, Iterator, TypedDict
 # third-party library
+from langchain_core.document_loaders import BaseLoader
 from langchain_core.documents import Document
 from langchain_core.vectorstores import VectorStore
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import (
+    BSHTMLLoader,
+    Docx2txtLoader,
+    PyPDFLoader,
+    TextLoader,
+)
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 from snowflake.snowpark import Session
 # local
+from rag_helpers.cache import EmbeddingCache
 from rag_helpers.embeddings import SnowflakeCortexEmbeddings
 from rag_helpers.vectorstore import SnowflakeCortexVectorStore
+from .pipeline import IngestPipeline
 
 # if os.getenv("LOCAL", "False") == "False":
 #     import sys
@@ -14,6 +25,30 @@ from rag_helpers.vectorstore import SnowflakeCortexVectorStore
 #     sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
 
 
+# file extension -> loader; PDF needs pypdf and HTML beautifulsoup4
+LOADERS: dict[str, Callable[[str], BaseLoader]] = {
+    ".docx": Docx2txtLoader,
+    ".pdf": PyPDFLoader,
+    ".md": lambda path: TextLoader(path, encoding="utf-8"),
+    ".markdown": lambda path: TextLoader(path, encoding="utf-8"),
+    ".html": lambda path: BSHTMLLoader(path, open_encoding="utf-8"),
+    ".htm": lambda path: BSHTMLLoader(path, open_encoding="utf-8"),
+}
+
+
+def get_loader(filename: str) -> BaseLoader:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported file type: {filename}")
+    return LOADERS[extension](filename)
+
+
+class IngestStats(TypedDict):
+    added: int
+    kept: int
+    removed: int
+
+
 class IngestData:
     def __init__(
         self,
@@ -22,19 +57,31 @@ class IngestData:
         model: str = "e5-base-v2",
         chunk_size: int = 256,
         chunk_overlap: int = 10,
+        vector_store_kwargs: dict | None = None,
+        embedding_cache: EmbeddingCache | None = None,
     ) -> None:
         self._topic = topic
         self._model = model
         self._chunk_size = chunk_size
         self._chunk_overlap = chunk_overlap
+        self._vector_store_kwargs = vector_store_kwargs or {}
         self.validate_and_init()
         self._session = session
         self._embeddings = SnowflakeCortexEmbeddings(
             session=self._session,
             model=self._model,
-            dimensions=self._dimensions
+            dimensions=self._dimensions,
+            cache=embedding_cache,
         )
 
+    @property
+    def embeddings(self) -> SnowflakeCortexEmbeddings:
+        return self._embeddings
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
     def validate_and_init(self) -> None:
         if self._model in {
             "snowflake-arctic-embed-m-v1.5",
@@ -57,35 +104,62 @@ class IngestData:
             raise ValueError("topic must be a string.")
 
     def load_document(self, filename: str) -> list[Document]:
-        loader = Docx2txtLoader(filename)
+        loader = get_loader(filename)
         documents = loader.load()
         return documents
 
-    def chunk_data(self, filename: str) -> list[Document]:
-        documents = self.load_document(filename)
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self._chunk_size, 
+    def lazy_load_document(self, filename: str) -> Iterator[Document]:
+        loader = get_loader(filename)
+        return loader.lazy_load()
+
+    def get_text_splitter(self) -> TextSplitter:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self._chunk_size,
             chunk_overlap=self._chunk_overlap
         )
+
+    def chunk_data(self, filename: str) -> list[Document]:
+        documents = self.load_document(filename)
+        text_splitter = self.get_text_splitter()
         chunks = text_splitter.split_documents(documents)
         return chunks
 
-    def build_embeddings(self, filename: str) -> VectorStore:
-        chunks = self.chunk_data(filename)
-        vector_store = SnowflakeCortexVectorStore.from_documents(
-            documents=chunks,
-            embedding=self._embeddings,
-            topic=self._topic,
-            dimensions=self._dimensions,
-            connection=self._session.connection
+    def get_pipeline(
+        self, filename: str, incremental: bool = False, source: str | None = None
+    ) -> IngestPipeline:
+        """``source`` identifies the document across uploads; it defaults
+        to ``filename``."""
+        return IngestPipeline(
+            documents=self.lazy_load_document(filename),
+            text_splitter=self.get_text_splitter(),
+            vector_store=self.get_vector_store(),
+            incremental=incremental,
+            source=source or filename,
         )
-        return vector_store
+
+    def build_embeddings(self, filename: str) -> VectorStore:
+        pipeline = self.get_pipeline(filename)
+        for _ in pipeline.run():
+            pass
+        return pipeline.vector_store
 
     def get_vector_store(self) -> VectorStore:
         vector_store = SnowflakeCortexVectorStore(
             connection=self._session.connection,
             topic=self._topic,
             embedding=self._embeddings,
-            dimensions=self._dimensions
+            dimensions=self._dimensions,
+            **self._vector_store_kwargs
         )
         return vector_store
+
+    def update_embeddings(self, filename: str) -> tuple[VectorStore, IngestStats]:
+        """
+        Incrementally sync the rows of this file with it: only chunks whose
+        content hash is not stored for the file yet are embedded and
+        inserted, and its rows whose chunk no longer appears are deleted.
+        """
+        pipeline = self.get_pipeline(filename, incremental=True)
+        for _ in pipeline.run():
+            pass
+        return pipeline.vector_store, IngestStats(**pipeline.stats)
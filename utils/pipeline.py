@@ -0,0 +1,213 @@
+# standard library
+import queue
+import threading
+import time
+from typing import Iterable, Iterator, Literal, TypedDict
+# third-party library
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+# local
+from rag_helpers.vectorstore import SnowflakeCortexVectorStore
+
+_DONE = object()
+
+
+class ProgressEvent(TypedDict):
+    stage: Literal["load", "split", "embed", "insert", "delete", "index", "done"]
+    count: int
+    elapsed: float
+    rate: float
+    fraction: float
+
+
+class IngestPipeline:
+    """
+    Streaming load -> split -> embed -> insert pipeline.
+
+    Each stage runs in its own thread and hands batches to the next one
+    through a bounded queue, so embedding of one batch overlaps with
+    splitting of the next and with insertion of the previous one, and at
+    most ``max_pending_batches`` batches are held in memory per queue.
+    ``run`` yields ProgressEvent dicts in the calling thread.
+
+    Every chunk is tagged with ``source`` in its metadata (the uploaded
+    file name, not a temporary path). When ``incremental`` is set, chunks
+    of that source whose content hash is already stored are skipped and
+    rows of that source whose chunk no longer appears are deleted once
+    everything else has been inserted; other sources are left alone. IVF stores are re-clustered at
+    the end. Without a ``text_splitter`` the documents are taken to be
+    chunks already, e.g. split in worker processes.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[Document],
+        text_splitter: TextSplitter | None,
+        vector_store: SnowflakeCortexVectorStore,
+        batch_size: int = 256,
+        max_pending_batches: int = 4,
+        incremental: bool = False,
+        source: str | None = None,
+    ) -> None:
+        if incremental and source is None:
+            raise ValueError("Incremental ingestion requires a source.")
+        self.documents = documents
+        self.text_splitter = text_splitter
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches
+        self.incremental = incremental
+        self.source = source
+        self.stats = {"added": 0, "kept": 0, "removed": 0}
+        self._counts = {
+            "load": 0, "split": 0, "embed": 0, "insert": 0, "delete": 0, "index": 0,
+        }
+        self._split_done = False
+        self._stop = threading.Event()
+        self._events: queue.Queue = queue.Queue()
+        self._existing: dict[str, list[str]] = {}
+        self._seen: set[str] = set()
+
+    def _put(self, q: queue.Queue, item: object) -> None:
+        # never block forever, so that a cancelled run can wind down
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue) -> object:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _event(self, stage: str) -> ProgressEvent:
+        elapsed = time.perf_counter() - self._start
+        count = self._counts.get(stage, self._counts["insert"])
+        total = self._counts["split"]
+        if stage == "done":
+            fraction = 1.0
+        elif total == 0:
+            fraction = 0.0
+        else:
+            # until splitting finishes the total is only a lower bound
+            fraction = self._counts["insert"] / total
+            if not self._split_done:
+                fraction = min(fraction, 0.5)
+        return ProgressEvent(
+            stage=stage,
+            count=count,
+            elapsed=elapsed,
+            rate=count / elapsed if elapsed > 0 else 0.0,
+            fraction=fraction,
+        )
+
+    def _split_stage(self, out: queue.Queue) -> None:
+        batch: list[Document] = []
+        for document in self.documents:
+            if self._stop.is_set():
+                return
+            self._counts["load"] += 1
+            self._events.put(self._event("load"))
+            if self.text_splitter is None:
+                chunks = [document]
+            else:
+                chunks = self.text_splitter.split_documents([document])
+            for chunk in chunks:
+                if self.source is not None:
+                    chunk.metadata["source"] = self.source
+                h = self.vector_store.content_hash(chunk.page_content)
+                if self.incremental:
+                    if h in self._seen:
+                        continue
+                    self._seen.add(h)
+                    if h in self._existing:
+                        self.stats["kept"] += 1
+                        continue
+                batch.append(chunk)
+                self._counts["split"] += 1
+                if len(batch) >= self.batch_size:
+                    self._put(out, batch)
+                    batch = []
+            self._events.put(self._event("split"))
+        if batch:
+            self._put(out, batch)
+        self._split_done = True
+        self._put(out, _DONE)
+
+    def _embed_stage(self, inp: queue.Queue, out: queue.Queue) -> None:
+        embeddings = self.vector_store.embeddings
+        while (batch := self._get(inp)) is not _DONE:
+            texts = [d.page_content for d in batch]
+            vectors = list(embeddings.embed_documents(texts))
+            self._counts["embed"] += len(batch)
+            self._events.put(self._event("embed"))
+            self._put(out, (batch, vectors))
+        self._put(out, _DONE)
+
+    def _insert_stage(self, inp: queue.Queue) -> None:
+        while (item := self._get(inp)) is not _DONE:
+            batch, vectors = item
+            self.vector_store.add_embeddings(
+                texts=[d.page_content for d in batch],
+                embeddings=vectors,
+                metadatas=[d.metadata for d in batch],
+            )
+            self._counts["insert"] += len(batch)
+            self.stats["added"] += len(batch)
+            self._events.put(self._event("insert"))
+        self._events.put(_DONE)
+
+    def _guard(self, target, *args) -> None:
+        try:
+            target(*args)
+        except BaseException as e:
+            self._stop.set()
+            self._events.put(e)
+
+    def run(self) -> Iterator[ProgressEvent]:
+        self._start = time.perf_counter()
+        if self.incremental:
+            self._existing = self.vector_store.get_content_hashes({"source": self.source})
+        chunks: queue.Queue = queue.Queue(maxsize=self.max_pending_batches)
+        embedded: queue.Queue = queue.Queue(maxsize=self.max_pending_batches)
+        threads = [
+            threading.Thread(target=self._guard, args=(self._split_stage, chunks)),
+            threading.Thread(target=self._guard, args=(self._embed_stage, chunks, embedded)),
+            threading.Thread(target=self._guard, args=(self._insert_stage, embedded)),
+        ]
+        for t in threads:
+            t.start()
+        try:
+            while (event := self._events.get()) is not _DONE:
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+        if self.incremental:
+            removed = [
+                u for h, uuids in self._existing.items()
+                if h not in self._seen for u in uuids
+            ]
+            if removed:
+                self.vector_store.delete(removed, filter={"source": self.source})
+            self.stats["removed"] = len(removed)
+            self._counts["delete"] = len(removed)
+            yield self._event("delete")
+        if self.vector_store.ivf and (self.stats["added"] or self.stats["removed"]):
+            # move the IVF centroids towards the new contents of the table;
+            # see build_ivf for when they are retrained from scratch
+            self._counts["index"] = self.vector_store.build_ivf(rebalance=True)
+            yield self._event("index")
+        if self.stats["added"] and not self.stats["removed"]:
+            # inserts only refresh the local index; delete() already saved
+            # it, added rows included
+            self.vector_store.save_index()
+        yield self._event("done")